@@ -4,6 +4,7 @@ JISC constants
 Constants for JISC wrangler
 """
 
+import errno
 import os
 import re
 
@@ -26,7 +27,10 @@ P_MASTER_SUBDAY = os.path.join(
 )
 P_LSIDYV = os.path.join("lsidyv[a-z0-9]{4}[a-z0-9]?[a-z0-9]?", "[A-Z]{4}-")
 P_LSIDYV_ANOMALY = os.path.join("lsidyv[a-z0-9]{4}[a-z0-9]?[a-z0-9]?", "[A-Z]{5}-")
-P_OSMAPS = os.path.join("OSMaps.*?(\\.shp|", "metadata)\\.xml$")
+# The suffix is anchored at the end of the path, so a greedy .* (which runs to
+# the end and backs off only as far as the suffix) finds the same matches as a
+# lazy one, without attempting the suffix at every position along the way.
+P_OSMAPS = os.path.join("OSMaps.*(\\.shp|", "metadata)\\.xml$")
 
 SERVICE_PATTERN = re.compile(P_SERVICE, re.IGNORECASE)
 SERVICE_SUBDAY_PATTERN = re.compile(P_SERVICE_SUBDAY, re.IGNORECASE)
@@ -34,7 +38,12 @@ MASTER_PATTERN = re.compile(P_MASTER, re.IGNORECASE)
 MASTER_SUBDAY_PATTERN = re.compile(P_MASTER_SUBDAY, re.IGNORECASE)
 LSIDYV_PATTERN = re.compile(P_LSIDYV)
 LISIDYV_ANOMALY_PATTERN = re.compile(P_LSIDYV_ANOMALY)
+# A literal substring of every path matching P_LSIDYV or P_LSIDYV_ANOMALY,
+# by which paths can be cheaply filtered before searching for either pattern.
+LSIDYV_PREFIX = "lsidyv"
 OS_MAPS_PATTERN = re.compile(P_OSMAPS)
+# A subday subscript at the end of a (subdirectory) path.
+SUBDAY_END_PATTERN = re.compile(P_SUBDAY + "$", re.IGNORECASE)
 
 # Do *not* include the anomalous pattern here.
 DIR_PATTERNS = [
@@ -46,11 +55,52 @@ DIR_PATTERNS = [
     OS_MAPS_PATTERN,
 ]
 
+# All of the above directory patterns combined into one, so each path need
+# only be searched once. The four dated patterns are merged into a single
+# (case-insensitive) alternative, with an optional subday subscript group,
+# so the engine tries one rather than four alternatives at each position.
+# The name of the matching alternative is given by the lastgroup attribute
+# of a match.
+DIR_PATTERN_NAMES = [
+    "service",
+    "service_subday",
+    "master",
+    "master_subday",
+    "lsidyv",
+    "os_maps",
+]
+P_DATED = os.path.join(
+    "([A-Z]{4}",
+    "[0-9]{4}",
+    "[0-9]{2}",
+    "[0-9]{2})(" + P_SUBDAY + ")?(",
+    ")(service|master)",
+    "",
+)
+COMBINED_DIR_PATTERN = re.compile(
+    f"(?P<dated>(?i:{P_DATED}))|(?P<lsidyv>{P_LSIDYV})|(?P<os_maps>{P_OSMAPS})"
+)
+# Indices of the groups within a COMBINED_DIR_PATTERN match of a dated path:
+# the title code & date subdirectories, the subday subscript, the separator
+# and the service/master subdirectory name.
+DATED_GROUP_SUBDIR = 2
+DATED_GROUP_SUBDAY = 3
+DATED_GROUP_SEP = 4
+DATED_GROUP_KIND = 5
+
 # Regex patterns for the STANDARDISED OUTPUT DIRECTORIES:
 # Note matches only end of line $.
 P_STANDARD_SUBDIR = os.path.join("[A-Z]{4}", "[0-9]{4}", "[0-9]{2}", "[0-9]{2}$")
 STANDARD_SUBDIR_PATTERN = re.compile(P_STANDARD_SUBDIR)
 
+# Byte patterns for rewriting alto2txt metadata XML without parsing it:
+# the publication id attribute, and the date of the (first) issue following
+# it. The date must be the first child of the issue element, so that it is
+# not confused with any other date element.
+PUBLICATION_ID_PATTERN = re.compile(rb'<publication\b[^>]*\bid="([0-9A-Za-z]{1,8})"')
+ISSUE_START_PATTERN = re.compile(rb"<issue\b[^>]*(?<!/)>")
+ISSUE_DATE_PATTERN = re.compile(rb"\s*<date>([0-9]{4})-([0-9]{2})-([0-9]{2})</date>")
+
 # Working filenames
 FILENAME_PREFIX = "jw_"
 NAME_LOGFILE = "jw.log"
@@ -69,6 +119,47 @@ LEN_TITLE_CODE_YM_DIR = len(os.path.join("ABCD", "YYYY", "MM", ""))
 LEN_TITLE_CODE_YMD_DIR = len(os.path.join("ABCD", "YYYY", "MM", "DD", ""))
 LEN_SUBDAY_SUBSCRIPT = len("_X")
 LEN_DAY = len("DD")
+
+# Number of threads with which to walk the (input) directory tree.
+WALK_MAX_WORKERS = 32
+# Number of directories found before the walk switches to threads (so small
+# trees are walked without starting any).
+WALK_THREADED_MIN_DIRS = 100
+
+# Default number of threads with which to process the title codes (the work
+# is I/O bound, so there may be more threads than CPUs).
+STUB_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Buffer sizes (in bytes) for writing working files in one go, and for
+# reading them in blocks.
+WRITE_BUFFER_SIZE = 1 << 20
+READ_BUFFER_SIZE = 1 << 20
+
+# Ways in which the path wrangler can write files to the output directory:
+# by copying them, by copying them with copy_file_range (which shares the data
+# on copy-on-write filesystems) or by hard linking them.
+LINK_MODES = ["copy", "reflink", "hardlink"]
+# Errors on hard linking a file for which it is copied instead (the source &
+# destination are on different filesystems, or the filesystem does not allow
+# (more) hard links).
+LINK_FALLBACK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK)
+
+# Hash algorithm (and read size, in bytes) for comparing duplicate files.
+# The hashes are only compared with each other, so a fast non-legacy hash is
+# used rather than MD5: SHA-256, which is hardware accelerated (SHA-NI or the
+# ARMv8 crypto extensions) on most current CPUs.
+HASH_ALGORITHM = "sha256"
+HASH_BLOCKSIZE = 1 << 20
+# Files up to this size (in bytes) are hashed via a memory map, in one call.
+HASH_MMAP_MAX_SIZE = 1 << 30
+# Number of file hashes to cache (an existing output file may be compared
+# with many duplicates of it).
+HASH_CACHE_SIZE = 4096
+
+# Number of parsed ISO dates to cache. Every file in an issue shares its date,
+# and the whole dataset spans some tens of thousands of distinct dates.
+ISO_DATE_CACHE_SIZE = 1 << 16
+
 PUPBLICATION_ELEMENT_NAME = "publication"
 PUBLICATION_ID_ATTRIBUTE_NAME = "id"
 ISSUE_ELEMENT_NAME = "issue"
@@ -77,6 +168,16 @@ INPUT_SUB_PATH_ELEMENT_NAME = ".//input_sub_path"
 
 # Data.
 TITLE_CODE_LOOKUP_FILE = "data/title_code_lookup.csv"
+# The parsed lookup is cached in this directory (under the user's cache
+# directory), in a file with this extension.
+TITLE_CODE_LOOKUP_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "jisc-wrangler",
+)
+TITLE_CODE_LOOKUP_CACHE_SUFFIX = ".pkl"
+# Version of the format of the cached lookup. Increment this whenever the
+# structure of the parsed lookup changes, so older cache files are rebuilt.
+TITLE_CODE_LOOKUP_CACHE_FORMAT = 1
 TITLE_CODE_LOOKUP_DELIMITER = "|"
 TITLE_INDEX = 0
 NLP_INDEX = 1
@@ -87,5 +188,23 @@ END_DAY_INDEX = 5
 END_MONTH_INDEX = 6
 END_YEAR_INDEX = 7
 
+# Month numbers by (truncated) month name, as found in the lookup file.
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+# Latest representable (year, month, day) date.
+MAX_DATE = (9999, 12, 31)
+
 # Suffix used to distinguish non-duplicates with conflicting filenames.
 ALT_FILENAME_SUFFIX = "_ALT"
@@ -15,19 +15,37 @@ ensure that paths and files quoted to in the metadata XML remain valid.
 """
 import argparse
 import csv
+import hashlib
 import logging
+import multiprocessing
 import os
+import pickle
 import sys
-import xml.etree.ElementTree as ET
-from datetime import datetime
+from bisect import bisect_right
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from shutil import copy
-from typing import Dict, Union
+from typing import Callable, Dict, Iterator, Set, Tuple, Union
 
 from tqdm import tqdm  # type: ignore
 
 from jisc_wrangler import constants, logutils, utils
 
+# Use the faster lxml parser if it is installed. Its API is a drop-in
+# replacement for the subset of ElementTree used here.
+try:
+    from lxml import etree as ET  # type: ignore
+except ImportError:
+    import xml.etree.ElementTree as ET  # type: ignore
+
+# Title code lookup table & memoized NLP code resolver, reusable XML parser
+# & already created output subdirectories, set once per worker process by
+# _init_worker.
+_LOOKUP = {}  # type: Dict
+_TO_NLP = None  # type: Union[Callable, None]
+_XML_PARSER = None  # type: Union[ET.XMLParser, None]
+_SEEN_DIRS = set()  # type: Set[str]
+
 
 def main():
     try:
@@ -50,83 +68,186 @@ def main():
 def process_inputs(args: argparse.Namespace) -> None:
     """Process all of the files under the input directory.
 
+    Files are processed independently by a pool of worker processes (or
+    threads, if requested), which are fed as the input directory is walked.
+
     Args:
         args (argparse.Namespace): Runtime parameters.
+
+    Raises:
+        RuntimeError: If a metadata file has no plaintext file.
     """
 
-    # Read the title code lookup file.
-    lookup = read_title_code_lookup_file()
+    # Read the title code lookup file (in the workers too, but read it here
+    # first to check it and to prepare its cache file).
+    read_title_code_lookup_file(constants.TITLE_CODE_LOOKUP_FILE)
+
+    # Walk the input directory lazily, so that processing can start before
+    # all of the metadata files have been found.
+    metadata_files = iter_metadata_files(args.input_dir)
+    process_file = partial(
+        _process_one,
+        input_root=Path(args.input_dir),
+        output_root=Path(args.output_dir),
+        dry_run=args.dry_run,
+    )
+
+    # Print a progress bar (the total is not known in advance).
+    print("Processing metadata files")
 
-    # Get the input metadata file full paths.
-    metadata_files = utils.list_files(args.input_dir, constants.METADATA_XML_SUFFIX)
+    file_count = 0
+    failure_count = 0
+    # Worker processes log via a queue to a single writer in this process
+    # (worker threads log directly).
+    with logutils.queue_logging(not args.threads) as log_queue, _make_executor(
+        args, constants.TITLE_CODE_LOOKUP_FILE, log_queue
+    ) as executor:
+        # Send files to the workers in chunks to amortise the IPC cost.
+        results = executor.map(process_file, metadata_files, chunksize=64)
+        try:
+            for _, failure_msg in tqdm(results, unit=" files"):
+                file_count += 1
+                if failure_msg is not None:
+                    failure_count += 1
+                    print(failure_msg + ". File was not written. Continuing...")
+        except BaseException:
+            # Don't start processing any more files after a failure (e.g. a
+            # missing plaintext file). Before Python 3.9, the pending files
+            # are only cancelled by the results iterator itself.
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    logging.info("Found %s metadata files.", file_count)
 
-    logging.info("Found %s metadata files.", len(metadata_files))
+    if failure_count > 0:
+        print(f"{failure_count} failures requiring manual intervention.")
 
-    # Print the number of files to be processed (and a progress bar).
-    print(f"Processing {len(metadata_files)} metadata files")
 
-    failure_count = 0
-    for file in tqdm(metadata_files):
-        logging.debug("Processing file %s", file)
+def _make_executor(
+    args: argparse.Namespace,
+    lookup_file: str,
+    log_queue: Union[multiprocessing.Queue, None],
+) -> Executor:
+    if args.threads:
+        # Threads share this process's state, so initialise it only once.
+        _init_worker(lookup_file, threaded=True)
+        return ThreadPoolExecutor(max_workers=args.jobs)
+    # Each worker loads the lookup itself, so only its path is pickled.
+    return ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=_init_worker,
+        initargs=(lookup_file, False, log_queue, logging.getLogger().level),
+    )
 
-        # Read the metadata XML file.
-        xml_tree = ET.parse(file)
 
-        # Replace the 4 character title code with the 7 character NLP code
-        # in the metadata XML.
-        try:
-            title_code, nlp = replace_publication_id(xml_tree, lookup)
-        except ValueError:
-            title_code, nlp = (None, None)
-
-        # If the publication code replacement failed, skip this file.
-        if title_code is None or nlp is None:
-            logging.warning("Skipping file %s & associated plaintext file", file)
-            continue
-
-        # Construct the output file path.
-        output_file = file.replace(args.input_dir, args.output_dir, 1)
-
-        # Write the modified XML tree to the output file.
-        if not args.dry_run:
-            output_dir = os.path.dirname(output_file)
-            if not os.path.isdir(output_dir):
-                Path(output_dir).mkdir(parents=True, exist_ok=True)
-                logging.info("Created subdirectory at %s", output_dir)
-
-            # xml_tree.write(output_file)
+def _init_worker(
+    lookup_file: str,
+    threaded: bool = False,
+    log_queue: Union[multiprocessing.Queue, None] = None,
+    log_level: int = logging.INFO,
+) -> None:
+    global _LOOKUP, _TO_NLP, _XML_PARSER, _SEEN_DIRS  # pylint: disable=global-statement
+    if log_queue is not None:
+        logutils.setup_worker_logging(log_queue, log_level)
+    _LOOKUP = read_title_code_lookup_file(lookup_file)
+    _TO_NLP = _make_title_code_to_nlp(_LOOKUP)
+    _SEEN_DIRS = set()
+    # An lxml parser can be reused across files (but not shared between
+    # threads); a stdlib one cannot.
+    if hasattr(ET, "LXML_VERSION") and not threaded:
+        _XML_PARSER = ET.XMLParser(huge_tree=False, remove_blank_text=False)
+
+
+def _process_one(
+    files: Tuple[str, Union[str, None]],
+    input_root: Path,
+    output_root: Path,
+    dry_run: bool,
+) -> Tuple[bool, Union[str, None]]:
+    """Process a single metadata file and its associated plaintext file.
+
+    Args:
+        files (tuple): Full paths to the metadata XML file and to its
+                       plaintext file (or None if there is no plaintext file).
+        input_root (Path): The input directory.
+        output_root (Path): The output directory.
+        dry_run (bool): Whether this is a dry run.
+
+    Raises:
+        RuntimeError: If the corresponding plaintext file is missing.
+
+    Returns:
+        tuple: Whether the file was processed successfully, and a failure
+               message if it requires manual intervention (otherwise None).
+    """
+    file, plaintext_file = files
+    logging.debug("Processing file %s", file)
+
+    # Read the metadata XML file.
+    data = Path(file).read_bytes()
+
+    # Replace the 4 character title code with the 7 character NLP code
+    # in the metadata XML. Edit the raw bytes where possible and only fall
+    # back to parsing the XML tree if that fails.
+    xml_tree = None
+    try:
+        replaced = replace_publication_id_bytes(data, _LOOKUP, _TO_NLP)
+        if replaced is None:
+            xml_tree = ET.ElementTree(ET.fromstring(data, parser=_XML_PARSER))
+            title_code, nlp = replace_publication_id(xml_tree, _LOOKUP, _TO_NLP)
+        else:
+            title_code, nlp, data = replaced
+    except ValueError:
+        title_code, nlp = (None, None)
+
+    # If the publication code replacement failed, skip this file.
+    if title_code is None or nlp is None:
+        logging.warning("Skipping file %s & associated plaintext file", file)
+        return False, None
+
+    # Construct the output file path, mirroring its path under the input
+    # directory.
+    output_path = output_root / Path(file).relative_to(input_root)
+    output_file = str(output_path)
+
+    # Write the modified XML to the output file.
+    if not dry_run:
+        # Only touch the filesystem the first time each subdirectory is seen.
+        output_subdir = os.path.dirname(output_file)
+        if output_subdir not in _SEEN_DIRS:
+            os.makedirs(output_subdir, exist_ok=True)
+            _SEEN_DIRS.add(output_subdir)
+            logging.info("Created subdirectory at %s", output_subdir)
+
+        # Serialise a modified tree in full so it is written in one call.
+        if xml_tree is not None:
             try:
-                with open(output_file, "wb") as open_f:
-                    xml_tree.write(open_f)
+                data = ET.tostring(
+                    xml_tree.getroot(), encoding="utf-8", xml_declaration=True
+                )
             except TypeError:
-                failure_count += 1
-                msg = "TypeError when writing XML ElementTree to {output_file}"
                 logging.error(
                     "TypeError when writing XML ElementTree to %s", output_file
                 )
-                os.remove(output_file)
-                print(msg + ". File was removed. Continuing...")
+                return False, f"TypeError when writing XML ElementTree to {output_file}"
+        output_path.write_bytes(data)
 
-        # Find the corresponding plaintext file.
-        plaintext_path = Path(
-            file.replace(constants.METADATA_XML_SUFFIX, constants.PLAINTEXT_EXTENSION)
-        )
-
-        if not plaintext_path.is_file():
-            msg = f"Failed to find plaintext file at: {plaintext_path}"
-            raise RuntimeError(msg)
+    # The corresponding plaintext file was found alongside it.
+    if plaintext_file is None:
+        stem_length = len(file) - len(constants.METADATA_XML_SUFFIX)
+        plaintext_path = file[:stem_length] + constants.PLAINTEXT_EXTENSION
+        msg = f"Failed to find plaintext file at: {plaintext_path}"
+        raise RuntimeError(msg)
 
-        # Construct the output plaintext file path.
-        output_plaintext_file = str(plaintext_path).replace(
-            args.input_dir, args.output_dir, 1
-        )
+    # Construct the output plaintext file path.
+    output_plaintext_file = str(output_path.with_name(os.path.basename(plaintext_file)))
 
-        # Copy the plain text file to the output directory.
-        if not args.dry_run:
-            copy(str(plaintext_path), output_plaintext_file)
+    # Link (or copy) the unmodified plain text file to the output directory.
+    if not dry_run:
+        utils.fast_copy(plaintext_file, output_plaintext_file)
 
-    if failure_count > 0:
-        print(f"{failure_count} failures requiring manual intervention.")
+    return True, None
 
 
 def validate(args: argparse.Namespace) -> None:
@@ -135,37 +256,76 @@ def validate(args: argparse.Namespace) -> None:
     Args:
         args (argparse.Namespace): Runtime parameters
     """
-    # Compare the number of input & output metadata files.
-    input_metadata_files = utils.list_files(
-        args.input_dir, constants.METADATA_XML_SUFFIX
-    )
-    output_metadata_files = utils.list_files(
-        args.output_dir, constants.METADATA_XML_SUFFIX
+    # Count the input & output metadata and plaintext files, in one walk of
+    # each directory.
+    input_metadata_count, input_plaintext_count = count_metadata_files(args.input_dir)
+    output_metadata_count, output_plaintext_count = count_metadata_files(
+        args.output_dir
     )
 
-    if len(input_metadata_files) != len(output_metadata_files):
+    # Compare the number of input & output metadata files.
+    if input_metadata_count != output_metadata_count:
         msg = "unequal input & output metadata file counts."
         logging.warning(msg)
         print(f"WARNING: {msg}")
 
     # Compare the number of input & output plaintext files.
-    input_plaintext_files = utils.list_files(
-        args.input_dir, constants.PLAINTEXT_EXTENSION
-    )
-    output_plaintext_files = utils.list_files(
-        args.output_dir, constants.PLAINTEXT_EXTENSION
-    )
-
-    if len(input_plaintext_files) != len(output_plaintext_files):
+    if input_plaintext_count != output_plaintext_count:
         msg = "unequal input & output plaintext file counts."
         logging.warning(msg)
         print(f"WARNING: {msg}")
 
-    logging.info("Processed %s metadata files.", len(output_metadata_files))
-    logging.info("Processed %s plaintext files.", len(output_plaintext_files))
+    logging.info("Processed %s metadata files.", output_metadata_count)
+    logging.info("Processed %s plaintext files.", output_plaintext_count)
+
+
+def iter_metadata_files(directory: str) -> Iterator[Tuple[str, Union[str, None]]]:
+    """Iterate over the metadata files under a directory, recursively, each
+    paired with its plaintext file.
+
+    Args:
+        directory (str): Directory to check.
+
+    Yields:
+        tuple: The path of a metadata XML file and the path of its plaintext
+               file, or None if it has no plaintext file.
+    """
+    for dirpath, filenames in utils.walk_files(directory):
+        names = set(filenames)
+        for filename in filenames:
+            if not filename.endswith(constants.METADATA_XML_SUFFIX):
+                continue
+            stem = filename[: len(filename) - len(constants.METADATA_XML_SUFFIX)]
+            plaintext_filename = stem + constants.PLAINTEXT_EXTENSION
+            plaintext_file = None
+            if plaintext_filename in names:
+                plaintext_file = os.path.join(dirpath, plaintext_filename)
+            yield os.path.join(dirpath, filename), plaintext_file
+
+
+def count_metadata_files(directory: str) -> Tuple[int, int]:
+    """Count the metadata and plaintext files under a directory, recursively.
 
+    Args:
+        directory (str): Directory to check.
 
-def replace_publication_id(xml_tree: ET.ElementTree, lookup: dict) -> tuple:
+    Returns:
+        tuple: The number of metadata XML files & of plaintext files.
+    """
+    metadata_count = 0
+    plaintext_count = 0
+    for _, filenames in utils.walk_files(directory):
+        for filename in filenames:
+            if filename.endswith(constants.METADATA_XML_SUFFIX):
+                metadata_count += 1
+            elif filename.endswith(constants.PLAINTEXT_EXTENSION):
+                plaintext_count += 1
+    return metadata_count, plaintext_count
+
+
+def replace_publication_id(
+    xml_tree: ET.ElementTree, lookup: dict, to_nlp: Union[Callable, None] = None
+) -> tuple:
     """Replace a 4-character title code with a 7-digit NLP code in an XML tree.
 
     The XML tree structure is assumed to contain a "publication" element with
@@ -175,6 +335,8 @@ def replace_publication_id(xml_tree: ET.ElementTree, lookup: dict) -> tuple:
     Args:
         xml_tree    (ElementTree): An XML ElementTree.
         lookup     (dict): A dictionary for NLP code lookups.
+        to_nlp      (Callable): Optional replacement for title_code_to_nlp
+                    already bound to the lookup, e.g. a memoized one.
 
     Raises:
         ValueError: Failed to find issue/date element in XML tree.
@@ -205,16 +367,21 @@ def replace_publication_id(xml_tree: ET.ElementTree, lookup: dict) -> tuple:
             raise ValueError("Failed to standardise title code.")
         title_code = standardised_title_code
 
-    date_str = pub_elem.find(
-        constants.ISSUE_ELEMENT_NAME + "/" + constants.DATE_ELEMENT_NAME
-    )
+    # Find the issue, then its date, directly rather than via a path
+    # expression.
+    issue_elem = pub_elem.find(constants.ISSUE_ELEMENT_NAME)
+    date_str = None
+    if issue_elem is not None:
+        date_str = issue_elem.find(constants.DATE_ELEMENT_NAME)
     if date_str is None:
         logging.warning("Failed to find issue/date element in XML tree.")
         raise ValueError("Failed to find issue/date element in XML tree.")
 
-    year, month, day = utils.parse_publicaton_date(str(date_str.text))
+    date = utils.parse_iso_date(str(date_str.text))
 
-    nlp = title_code_to_nlp(title_code, year, month, day, lookup)
+    if to_nlp is None:
+        to_nlp = partial(title_code_to_nlp, lookup=lookup)
+    nlp = to_nlp(title_code, date)
 
     if nlp is None:
         logging.warning("Failed to get NLP for title code %s", title_code)
@@ -230,6 +397,62 @@ def replace_publication_id(xml_tree: ET.ElementTree, lookup: dict) -> tuple:
     return (title_code, nlp)
 
 
+def replace_publication_id_bytes(
+    data: bytes, lookup: dict, to_nlp: Union[Callable, None] = None
+) -> Union[tuple, None]:
+    """Replace a 4-character title code with a 7-digit NLP code in raw XML.
+
+    A fast alternative to replace_publication_id that avoids building and
+    serialising an XML tree: only the value of the publication "id" attribute
+    is changed and all other bytes are left untouched.
+
+    Args:
+        data        (bytes): The contents of a metadata XML file.
+        lookup     (dict): A dictionary for NLP code lookups.
+        to_nlp      (Callable): Optional replacement for title_code_to_nlp
+                    already bound to the lookup, e.g. a memoized one.
+
+    Raises:
+        ValueError: Failed to get NLP for title code.
+
+    Returns:
+        tuple: The 4-character title code, the 7-digit NLP code & the modified
+               XML, or None if the XML must instead be handled by parsing it
+               (i.e. the expected elements were not found or the title code
+               is non-standard).
+    """
+
+    pub_match = constants.PUBLICATION_ID_PATTERN.search(data)
+    if pub_match is None:
+        return None
+
+    title_code = pub_match.group(1).decode("ascii")
+    if title_code not in lookup:
+        return None
+
+    # The date must immediately follow the issue start tag (otherwise it is
+    # left to the XML tree fallback to find the issue's date).
+    issue_match = constants.ISSUE_START_PATTERN.search(data, pub_match.end())
+    if issue_match is None:
+        return None
+    date_match = constants.ISSUE_DATE_PATTERN.match(data, issue_match.end())
+    if date_match is None:
+        return None
+
+    date = tuple(int(group) for group in date_match.groups())
+
+    if to_nlp is None:
+        to_nlp = partial(title_code_to_nlp, lookup=lookup)
+    nlp = to_nlp(title_code, date)
+
+    if nlp is None:
+        logging.warning("Failed to get NLP for title code %s", title_code)
+        raise ValueError("Failed to get NLP for title code.")
+
+    start, end = pub_match.span(1)
+    return (title_code, nlp, data[:start] + nlp.encode("ascii") + data[end:])
+
+
 def standardise_title_code(
     title_code: str, xml_tree: ET.ElementTree
 ) -> Union[str, None]:
@@ -241,6 +464,9 @@ def standardise_title_code(
         title_code  (str): A non-standard JISC title code.
         xml_tree    (ElementTree): An XML ElementTree.
 
+    Raises:
+        ValueError: Failed to find input_sub_path element in XML tree.
+
     Returns: the corresponding standard title code or None if no
     standardisation is available.
     """
@@ -249,7 +475,8 @@ def standardise_title_code(
     if title_code[0:4] == "NCBL" or title_code[0:5] == "BL000":
         # Extract the correct title code from the input subdirectory path.
         xml_tree_obj = xml_tree.find(constants.INPUT_SUB_PATH_ELEMENT_NAME)
-        assert isinstance(xml_tree_obj, ET.Element)
+        if xml_tree_obj is None:
+            raise ValueError("Failed to find input_sub_path element in XML tree.")
         input_sub_path_elem = str(xml_tree_obj.text)
         logging.info(
             "Extracted title code from subdirectory path: %s", input_sub_path_elem
@@ -260,16 +487,15 @@ def standardise_title_code(
 
 
 def title_code_to_nlp(
-    title_code: str, year: str, month: str, day: str, lookup: dict
+    title_code: str, date: Tuple[int, int, int], lookup: dict
 ) -> Union[str, None]:
     """Convert a 4-character title code to a 7-digit NLP code. Also supports
     non-standard title codes if found in the lookup table.
 
     Args:
         title_code  (str): A 4-character or JISC title code.
-        year        (str): A publication year in YYYY format.
-        month       (str): A publication month in MM format.
-        day         (str): A publication day in DD format.
+        date        (tuple): A publication date as a (year, month, day) tuple
+                    of integers.
         lookup     (dict): A dictionary for NLP code lookups.
 
     Returns: the 7-digit NLP code for the title (and date) as a string,
@@ -281,49 +507,160 @@ def title_code_to_nlp(
         logging.warning("Title code %s not found in lookup table.", title_code)
         return None
 
-    date = datetime.strptime(day + "-" + month + "-" + year, "%d-%m-%Y")
-    for entry in code_lookup:
-        date_range = entry[0]
-        if utils.date_in_range(date_range[0], date_range[1], date):
-            return entry[1]
+    # The entries are sorted by start date, so only the ranges starting on or
+    # before the date can contain it: usually the last of these but, where
+    # ranges overlap (e.g. one contains another), possibly an earlier one.
+    # Overlapping ranges have the same NLP code (see
+    # read_title_code_lookup_file), so any range containing the date will do.
+    # The search key sorts after any entry starting on the date itself.
+    i = bisect_right(code_lookup, ((date, constants.MAX_DATE),))
+    for j in range(i - 1, -1, -1):
+        if date <= code_lookup[j][0][1]:
+            return code_lookup[j][1]
 
     logging.warning("Date out of range for title code %s in lookup table.", title_code)
     return None
 
 
-def read_title_code_lookup_file() -> dict:
+def _make_title_code_to_nlp(lookup: dict) -> Callable[..., Union[str, None]]:
+    """Make a memoized title_code_to_nlp bound to a lookup table.
+
+    The same title code & date recur across every item in an issue, so each
+    distinct combination is only resolved once.
+
+    Args:
+        lookup     (dict): A dictionary for NLP code lookups.
+
+    Returns: a function taking the title code & date arguments of
+             title_code_to_nlp.
+    """
+
+    @lru_cache(maxsize=None)
+    def to_nlp(title_code: str, date: Tuple[int, int, int]) -> Union[str, None]:
+        return title_code_to_nlp(title_code, date, lookup)
+
+    return to_nlp
+
+
+@lru_cache(maxsize=1)
+def read_title_code_lookup_file(
+    lookup_file: str = constants.TITLE_CODE_LOOKUP_FILE,
+    cache_dir: Union[str, None] = None,
+) -> dict:
     """Read the csv daa file for title code lookups.
 
-    Returns: dict: A dictionary keyed by title code. Values are pairs in which
-             the first element is a date range (i.e. a pair of datetime objects).
-             and the second element is the corresponding NLP code.
+    The parsed table is cached in a pickle file in the cache directory, which
+    is reused for as long as the csv file's modification time & size (and
+    the format of the parsed table) are unchanged. The result is also cached
+    in memory, so it must not be modified.
+
+    Args:
+        lookup_file (str, optional): Path to the csv file. Defaults to the
+                                     bundled title code lookup file.
+        cache_dir (str, optional): Directory in which to cache the parsed
+                                   table. Defaults to
+                                   constants.TITLE_CODE_LOOKUP_CACHE_DIR (a
+                                   jisc-wrangler directory in the user's
+                                   cache directory).
+
+    Raises:
+        ValueError: If overlapping date ranges for a title code have different
+                    NLP codes.
+
+    Returns: dict: A dictionary keyed by title code. Values are lists of pairs,
+             sorted by start date, in which the first element is a date range
+             (i.e. a pair of (year, month, day) tuples of integers) and the
+             second element is the corresponding NLP code.
     """
 
-    # Read the title code lookup file.
-    rows = []
-    with open(constants.TITLE_CODE_LOOKUP_FILE, encoding="utf-8") as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=constants.TITLE_CODE_LOOKUP_DELIMITER)
-        for row in csvreader:
-            rows.append(row)
+    # Name the cache file after the csv file, and a hash of its full path so
+    # that different csv files with the same name have different caches.
+    if cache_dir is None:
+        cache_dir = constants.TITLE_CODE_LOOKUP_CACHE_DIR
+    lookup_file = os.path.abspath(lookup_file)
+    path_hash = hashlib.sha256(lookup_file.encode("utf-8")).hexdigest()[:16]
+    cache_file = os.path.join(
+        cache_dir,
+        f"{Path(lookup_file).stem}-{path_hash}"
+        + constants.TITLE_CODE_LOOKUP_CACHE_SUFFIX,
+    )
+    stat = os.stat(lookup_file)
+    header = (
+        constants.TITLE_CODE_LOOKUP_CACHE_FORMAT,
+        lookup_file,
+        stat.st_mtime_ns,
+        stat.st_size,
+    )
+    cached = _load_title_code_lookup_cache(cache_file, header)
+    if cached is not None:
+        return cached
 
     ret = {}  # type: Dict
-    # Ignore the header row.
-    for row in rows[1:]:
-        start = parse_lookup_date(row, start=True)
-        end = parse_lookup_date(row, start=False)
-        # Pad the NLP code to 7 characters.
-        nlp = row[constants.NLP_INDEX].strip().rjust(7, "0")
-        title_code = row[constants.TITLE_INDEX].strip()
-
-        element = ((start, end), nlp)
-        # If the title code is not already in the dictionary, add it.
-        if title_code not in ret:
-            ret[title_code] = []
-        ret[title_code].append(element)
+    # Read the title code lookup file, parsing each row as it is read.
+    with open(lookup_file, encoding="utf-8", newline="") as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=constants.TITLE_CODE_LOOKUP_DELIMITER)
+        # Ignore the header row.
+        next(csvreader, None)
+        for row in csvreader:
+            start = parse_lookup_date(row, start=True)
+            end = parse_lookup_date(row, start=False)
+            # Pad the NLP code to 7 characters. Intern the codes, which recur
+            # across rows and are used as keys.
+            nlp = sys.intern(row[constants.NLP_INDEX].strip().rjust(7, "0"))
+            title_code = sys.intern(row[constants.TITLE_INDEX].strip())
+
+            element = ((start, end), nlp)
+            # If the title code is not already in the dictionary, add it.
+            ret.setdefault(title_code, []).append(element)
+
+    # Sort the date ranges so they can be searched by bisection, and check
+    # that overlapping ranges agree, so it does not matter which of them is
+    # found to contain a date.
+    for title_code, code_lookup in ret.items():
+        code_lookup.sort(key=lambda entry: entry[0][0])
+        for index, ((_, end), nlp) in enumerate(code_lookup):
+            for (later_start, _), later_nlp in code_lookup[index + 1 :]:
+                if later_start <= end and later_nlp != nlp:
+                    msg = f"Overlapping date ranges for title code {title_code}"
+                    msg += f" have different NLP codes in {lookup_file}."
+                    raise ValueError(msg)
+
+    _save_title_code_lookup_cache(cache_file, header, ret)
     return ret
 
 
-def parse_lookup_date(row: list, start: bool) -> datetime:
+def _load_title_code_lookup_cache(cache_file: str, header: tuple) -> Union[dict, None]:
+    # The header (cache format, csv path, modification time & size) is
+    # pickled separately, ahead of the table, so that a cache with a different
+    # header is rejected without unpickling a table of the wrong format.
+    try:
+        with open(cache_file, "rb") as cachefile:
+            if pickle.load(cachefile) != header:
+                return None
+            lookup = pickle.load(cachefile)
+    except Exception:  # pylint: disable=broad-exception-caught
+        # A missing or unreadable cache is simply rebuilt.
+        return None
+    if not isinstance(lookup, dict):
+        return None
+    return lookup
+
+
+def _save_title_code_lookup_cache(cache_file: str, header: tuple, lookup: dict) -> None:
+    # Write to a temporary file first, so that a worker process never reads
+    # a partially written cache.
+    temp_file = f"{cache_file}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(temp_file, "wb") as cachefile:
+            pickle.dump(header, cachefile, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(lookup, cachefile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        logging.warning("Failed to write title code lookup cache file.")
+
+
+def parse_lookup_date(row: list, start: bool) -> Tuple[int, int, int]:
     """Parse a date from a lookup table row.
 
     Args:
@@ -331,7 +668,7 @@ def parse_lookup_date(row: list, start: bool) -> datetime:
         start (bool): Whether to go from the start or not.
 
     Returns:
-        datetime: The parsed date.
+        tuple: The parsed date as a (year, month, day) tuple of integers.
     """
 
     if start:
@@ -343,13 +680,12 @@ def parse_lookup_date(row: list, start: bool) -> datetime:
         month_index = constants.END_MONTH_INDEX
         year_index = constants.END_YEAR_INDEX
 
-    # Pad the day to 2 characters.
-    day = row[day_index].strip().rjust(2, "0")
+    day = int(row[day_index])
     # Truncate the month to 3 characters
-    month = row[month_index].strip()[0:3]
-    year = row[year_index].strip()
+    month = constants.MONTHS[row[month_index].strip()[0:3]]
+    year = int(row[year_index])
 
-    return datetime.strptime(day + "-" + month + "-" + year, "%d-%b-%Y")
+    return (year, month, day)
 
 
 ##
@@ -383,6 +719,19 @@ def parse_args() -> argparse.Namespace:
         help="Working directory to which temporary & log files are written",
     )
 
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (defaults to the number of CPUs)",
+    )
+
+    parser.add_argument(
+        "--threads",
+        action="store_true",
+        help="Use worker threads instead of processes (e.g. for I/O-bound runs)",
+    )
+
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -429,16 +778,14 @@ def setup_directories(args: argparse.Namespace) -> None:
     """
 
     # Check the input directory path exists.
-    if not os.path.exists(args.input_dir):
+    if not os.path.isdir(args.input_dir):
         raise ValueError("Please provide a valid input directory.")
 
     # Prepare the output directory.
-    if not os.path.exists(args.output_dir):
-        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
 
     # Check the output directory is empty.
-    outputdir = [str(f) for f in Path(args.output_dir).rglob("*") if os.path.isfile(f)]
-    if len(outputdir) > 0:
+    if next(utils.iter_files(args.output_dir), None) is not None:
         raise RuntimeError("Output directory must be initially empty.")
 
 
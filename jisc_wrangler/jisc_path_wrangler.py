@@ -7,13 +7,13 @@ JISC newspaper XML files.
 import argparse
 import logging
 import os
-import re
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from distutils.dir_util import copy_tree
-from pathlib import Path
-from shutil import copy
-from typing import Pattern, Union
+from itertools import groupby
+from operator import itemgetter
+from shutil import copy, copy2, copytree
+from typing import Callable, Dict, Match, Set, Union
 
 from tqdm import tqdm  # type: ignore
 
@@ -31,6 +31,8 @@ def main():
 
         # Process all of the files under the input directory.
         process_inputs(args)
+        # Flush the duplicates & ignored files before they are counted.
+        utils.close_appended_files()
 
         # Check that all of the input files were processed.
         validate(existing_output_files, args)
@@ -39,6 +41,8 @@ def main():
         logging.exception(str(e))
         print(f"ERROR: {str(e)}")
         sys.exit()
+    finally:
+        utils.close_appended_files()
 
 
 def process_inputs(args: argparse.Namespace) -> None:
@@ -48,51 +52,104 @@ def process_inputs(args: argparse.Namespace) -> None:
         args (argparse.Namespace): Runtime parameters.
 
     Raises:
-        RuntimeError: If the sub matches == 0.
-        RuntimeError: If there are left over files.
+        RuntimeError: If any input files do not match a directory pattern.
     """
 
+    # Record the output subdirectories known to exist (see determine_from_to),
+    # starting with those already in the output directory, so they need not
+    # each be checked on the filesystem for every input file.
+    args.known_dirs = set(utils.list_all_subdirs(args.output_dir))
+
     # Look at the input file paths & extract the 'stubs'.
-    all_files = utils.list_files(args.input_dir, sort_them=True)
+    all_files = utils.list_files(
+        args.input_dir, sort_them=True, max_workers=constants.WALK_MAX_WORKERS
+    )
     logging.info("Found %s input files.", len(all_files))
 
     # Preprocess P_LSIDYV_ANOMALY files to correct the anomalous title code.
-    fix_anomalous_title_codes(all_files, args.working_dir)
+    fix_anomalous_title_codes(all_files, args.working_dir, max_workers=args.jobs)
 
-    all_stubs = extract_file_path_stubs(all_files, args.working_dir, sort_them=True)
+    # Extract the stubs (in the same order as the files, some of which may now
+    # be in the working directory) & group the files by stub & title code.
+    all_stubs = extract_file_path_stubs(all_files, args.working_dir)
+    stub_runs = group_by_title_code(all_stubs, all_files)
 
-    # Get a sorted list of _unique_ file path stubs.
-    unique_stubs = utils.remove_duplicates(all_stubs, sort_them=True)
-    logging.info("Found %s unique file path stubs.", len(unique_stubs))
+    num_unique_stubs = sum(len(runs) for runs in stub_runs.values())
+    logging.info("Found %s unique file path stubs.", num_unique_stubs)
 
     # Print the number of titles to be processed (and a progress bar).
-    msg = f"Processing {len(unique_stubs)} unique title code "
-    msg += "directory..." if len(unique_stubs) == 1 else "directories..."
+    msg = f"Processing {num_unique_stubs} unique title code "
+    msg += "directory..." if num_unique_stubs == 1 else "directories..."
     print(msg)
 
-    # Iterate over the unique stubs.
-    leftover_files = all_files
-    leftover_stubs = all_stubs
-    for stub in tqdm(unique_stubs):
-        # Count the number of leftover stubs matching this unique stub.
-        i = utils.count_matches_in_list(stub, leftover_stubs)
+    # Stubs with the same title code write to the same output subdirectory,
+    # so are processed in order, in one thread. Distinct title codes are
+    # processed concurrently (the work is dominated by file I/O).
+    with tqdm(total=num_unique_stubs) as progress, ThreadPoolExecutor(
+        max_workers=args.jobs
+    ) as executor:
+        futures = {
+            executor.submit(process_stubs, runs, args): len(runs)
+            for runs in stub_runs.values()
+        }
+        try:
+            for future in as_completed(futures):
+                future.result()
+                progress.update(futures[future])
+        except BaseException:
+            # Don't start processing any more title codes after a failure.
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def group_by_title_code(stubs: list, files: list) -> Dict[str, list]:
+    """Group files by their stubs, and the stubs by their title codes.
+
+    Each file is kept with its own stub, whatever the order of the files.
 
-        # Sanity check that we have a non-zero number of matches.
-        if i == 0:
-            msg = f"Found zero matches for the unique stub: {stub}"
-            raise RuntimeError(msg)
+    Args:
+        stubs (list): File path stubs (see extract_file_path_stubs).
+        files (list): The full paths of the files, in the same order as their
+                      stubs.
 
-        # Process all of the leftover files matching the current stub.
-        process_stub(stub, leftover_files[:i], args)
+    Returns:
+        dict: Lists of (stub, full paths) pairs, keyed by title code (see
+              stub_title_code). The pairs are in order of stub, and the full
+              paths for each stub are sorted.
+    """
+    stub_runs = {}  # type: Dict[str, list]
+    for stub, pairs in groupby(sorted(zip(stubs, files)), key=itemgetter(0)):
+        stub_runs.setdefault(stub_title_code(stub), []).append(
+            (stub, [file for _, file in pairs])
+        )
+    return stub_runs
 
-        # When all full paths corresponding to the current stub have been
-        # processed, update the lists of leftover files & stubs.
-        leftover_files = leftover_files[i:]
-        leftover_stubs = leftover_stubs[i:]
 
-    if len(leftover_files) != 0:
-        msg = f"All stubs processed but {len(leftover_files)} leftover files."
-        raise RuntimeError(msg)
+def stub_title_code(stub: str) -> str:
+    """Get the (standardised) title code at the end of a file path stub.
+
+    Args:
+        stub (str): A file path stub (see extract_file_path_stubs).
+
+    Returns:
+        str: The title code, in upper case.
+    """
+    # The stubs of lsidyv files also include the hyphen after the title code.
+    return stub.rstrip("-")[-constants.LEN_TITLE_CODE :].upper()
+
+
+def process_stubs(stub_runs: list, args: argparse.Namespace) -> None:
+    """Process file path stubs one after another.
+
+    Args:
+        stub_runs (list): Pairs of a stub and the list of full paths to the
+                          files matching it.
+        args (argparse.Namespace): Runtime parameters.
+    """
+    for stub, full_paths in stub_runs:
+        # Process all of the files matching the current stub.
+        process_stub(stub, full_paths, args)
 
 
 def process_stub(stub: str, full_paths: list, args: argparse.Namespace) -> None:
@@ -110,22 +167,22 @@ def process_stub(stub: str, full_paths: list, args: argparse.Namespace) -> None:
     """
 
     logging.info(">>> Processing stub: %s", stub)
-    # Count the number of leftover stubs corresponding to this stub.
 
-    while len(full_paths) != 0:
-        full_path = full_paths[0]
+    # Index of the first full path still to be processed.
+    cursor = 0
+    while cursor != len(full_paths):
+        full_path = full_paths[cursor]
         processed = process_full_path(full_path, len(stub), args)
 
         logging.debug("Processing of full path: %s returned: %s", full_path, processed)
 
-        # Remove the full_paths that have been processed. If processed is
+        # Skip the full_paths that have been processed. If processed is
         # None,  only a single full path was processed. Otherwise, all of the
         # full_paths that begin with the processed string have been processed.
         if processed is None:
-            num_processed_paths = 1
+            cursor += 1
         else:
-            num_processed_paths = utils.count_matches_in_list(processed, full_paths)
-        full_paths = full_paths[num_processed_paths:]
+            cursor += utils.count_matches_in_list(processed, full_paths, cursor)
 
     logging.info(">>> Finished processing stub: %s", stub)
 
@@ -171,19 +228,32 @@ def process_full_path(
 
     # Get the part of the full path that can be handled in this step by
     # inspecting the existing output directory structure.
-    from_to = determine_from_to(full_path, stub_length, args.output_dir)
+    from_to = determine_from_to(
+        full_path, stub_length, args.output_dir, args.known_dirs
+    )
 
     # If the "copy from" is the whole of the full_path, handle a single file
+    copy_function = utils.copy_function(args.link_mode)
     if from_to[0] is None:
-        process_duplicate_file(full_path, from_to, args.working_dir, args.dry_run)
+        process_duplicate_file(
+            full_path, from_to, args.working_dir, args.dry_run, copy_function
+        )
     elif from_to[0] == full_path:
-        process_single_file(from_to, args.dry_run)
+        process_single_file(from_to, args.dry_run, copy_function)
     else:
-        process_subdir(from_to, args.dry_run)
+        # Copied subdirectories keep the files' timestamps (unlike single
+        # copied files).
+        copy_function = utils.copy_function(args.link_mode, preserve_times=True)
+        process_subdir(from_to, args.dry_run, copy_function)
     return from_to[0]
 
 
-def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tuple:
+def determine_from_to(
+    full_path: str,
+    stub_length: int,
+    output_dir: str,
+    known_dirs: Union[Set[str], None] = None,
+) -> tuple:
     """Determine what part of the given full path can be handled in a single
     copy operation by examining the existing output directory structure.
 
@@ -192,6 +262,11 @@ def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tupl
         stub_length (int): The number of chars in the full_path up to &
                            including the title code.
         output_dir (str): The output directory.
+        known_dirs (set, optional): Output subdirectories known to exist,
+                           which need not be checked on the filesystem. Those
+                           found to exist are added to it. (Standardised
+                           output subdirectories are never removed, so the
+                           set does not go stale.) Defaults to None.
 
     Returns:
         tuple: The part of the full path that can be handled in a single copy
@@ -199,17 +274,24 @@ def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tupl
                operation, or None if a matching output file already exists.
     """
 
+    mpat = constants.COMBINED_DIR_PATTERN.search(full_path)
+    lastgroup = mpat.lastgroup if mpat else None
+
+    # Standardise the full path once, and truncate that for each candidate
+    # output subdirectory depth.
+    std_subdir = standardised_output_subdir(full_path, mpat)
+
     # Handle lsidvv files one at a time because their full paths do not include
     # YYYY/MM/DD subdirectories.
-    if constants.LSIDYV_PATTERN.search(full_path):
+    if lastgroup == "lsidyv":
         # The length of the target subdirectory in this case always includes
         # the year, month and day (because we're processing a single file).
         len_subdir = constants.LEN_TITLE_CODE_YMD_DIR
-        out_dir = target_output_subdir(full_path, len_subdir, output_dir)
+        out_dir = os.path.join(output_dir, std_subdir[:len_subdir])
 
         # Create the output directory if it doesn't already exist.
-        if not os.path.isdir(out_dir):
-            Path(out_dir).mkdir(parents=True, exist_ok=True)
+        if not is_known_dir(out_dir, known_dirs):
+            os.makedirs(out_dir, exist_ok=True)
             logging.info("Created subdirectory at %s", out_dir)
 
     # Handle regular (i.e. non-lsidyv_pattern) files by checking which output
@@ -233,10 +315,10 @@ def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tupl
         for len_subdir in len_titles:
             # Get the target output directory for this file (full_path) assuming
             # the current subdirectory depth.
-            out_dir = target_output_subdir(full_path, len_subdir, output_dir)
+            out_dir = os.path.join(output_dir, std_subdir[:len_subdir])
 
             # If that target subdirectory doesn't already exist...
-            if not os.path.isdir(out_dir):
+            if not is_known_dir(out_dir, known_dirs):
                 # ...then that's the part of the full_path that can be handled.
                 len_path = stub_length + len_subdir - constants.LEN_TITLE_CODE
 
@@ -245,9 +327,9 @@ def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tupl
                 # subdir is to be copied, extend the length of the 'copy from'
                 # path by the length of the subscript.
                 if len_subdir == constants.LEN_TITLE_CODE_YMD_DIR:
-                    if constants.SERVICE_SUBDAY_PATTERN.search(
-                        full_path
-                    ) or constants.MASTER_SUBDAY_PATTERN.search(full_path):
+                    if lastgroup == "dated" and mpat.group(
+                        constants.DATED_GROUP_SUBDAY
+                    ):
                         len_path += constants.LEN_SUBDAY_SUBSCRIPT
 
                 return full_path[:len_path], out_dir
@@ -263,7 +345,30 @@ def determine_from_to(full_path: str, stub_length: int, output_dir: str) -> tupl
     return None, target_file
 
 
-def process_single_file(from_to: tuple, dry_run: bool) -> None:
+def is_known_dir(path: str, known_dirs: Union[Set[str], None]) -> bool:
+    """Check whether a directory exists, remembering those that do.
+
+    Args:
+        path (str): The path to the directory.
+        known_dirs (set, optional): Directories known to exist, or None to
+                                    always check the filesystem.
+
+    Returns:
+        bool: Whether the directory exists.
+    """
+    if known_dirs is None:
+        return os.path.isdir(path)
+    if path in known_dirs:
+        return True
+    if os.path.isdir(path):
+        known_dirs.add(path)
+        return True
+    return False
+
+
+def process_single_file(
+    from_to: tuple, dry_run: bool, copy_function: Callable = copy
+) -> None:
     """Process a single file by copying to the appropriate output directory.
 
     Args:
@@ -271,14 +376,24 @@ def process_single_file(from_to: tuple, dry_run: bool) -> None:
                          single copy operation, and the target output
                          subdirectory for the copy.
         dry_run (bool): Whether this is a dry run.
+        copy_function (Callable, optional): The function with which to copy
+                         the file (see utils.copy_function). Defaults to
+                         shutil.copy.
     """
     if not dry_run:
-        copy(from_to[0], from_to[1])
+        dst = from_to[1]
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(from_to[0]))
+        copy_function(from_to[0], dst)
     logging.info("Copied file from %s to %s", from_to[0], from_to[1])
 
 
 def process_duplicate_file(
-    full_path: str, from_to: tuple, working_dir: str, dry_run: bool
+    full_path: str,
+    from_to: tuple,
+    working_dir: str,
+    dry_run: bool,
+    copy_function: Callable = copy,
 ) -> None:
     """Process a duplicate file that already exists in the output directory.
 
@@ -289,21 +404,18 @@ def process_duplicate_file(
                          subdirectory for the copy.
         working_dir (str): The path to the working directory.
         dry_run (bool): Flag indicating whether this is a dry run
+        copy_function (Callable, optional): The function with which to copy
+                         a conflicting file (see utils.copy_function).
+                         Defaults to shutil.copy.
     """
 
-    # Hash both the current file and the existing one in the output directory.
-    hash_new = utils.hash_file(full_path)
-    hash_original = utils.hash_file(from_to[1])
-
-    # Compare the two hashes.
-    if hash_new == hash_original:
+    # Compare the current file with the existing one in the output directory.
+    if utils.same_file_contents(full_path, from_to[1]):
         # If they're equal, append a line to the duplicates file.
-        with open(
+        utils.append_line(
             os.path.join(working_dir, constants.NAME_DUPLICATES_FILE),
-            "a+",
-            encoding="utf-8",
-        ) as openfile:
-            openfile.write(f"{from_to[1]} duplicated at {full_path}\n")
+            f"{from_to[1]} duplicated at {full_path}",
+        )
         logging.info("Added file %s to the duplicates list.", full_path)
     else:
         # Otherwise, log a warning and modify the output filename of the dupe.
@@ -312,10 +424,12 @@ def process_duplicate_file(
             "%sInput file: %s\nConflicts with: %s", msg, full_path, from_to[1]
         )
         alt_from_to = (full_path, utils.alt_output_file(from_to[1]))
-        process_single_file(alt_from_to, dry_run)
+        process_single_file(alt_from_to, dry_run, copy_function)
 
 
-def process_subdir(from_to: tuple, dry_run: bool) -> None:
+def process_subdir(
+    from_to: tuple, dry_run: bool, copy_function: Callable = copy2
+) -> None:
     """Process a subdirectory by copying to the appropriate output directory
     and standardise the subdirectory names.
 
@@ -324,12 +438,19 @@ def process_subdir(from_to: tuple, dry_run: bool) -> None:
                          single copy operation, and the target output
                          subdirectory for the copy.
         dry_run (bool): Flag indicating whether this is a dry run.
+        copy_function (Callable, optional): The function with which to copy
+                         each file (see utils.copy_function). Defaults to
+                         shutil.copy2, which (like the copy_tree function
+                         used formerly) keeps the files' timestamps.
     """
 
     # If the copy_from is a directory, make a directory with the same name
-    # under the output directory and copy its contents. (Note the copy_tree
+    # under the output directory and copy its contents. (Note the copytree
     # function automatically creates the destination directory.)
-    copy_tree(src=from_to[0], dst=from_to[1], dry_run=dry_run)
+    if not dry_run:
+        copytree(
+            from_to[0], from_to[1], copy_function=copy_function, dirs_exist_ok=True
+        )
     logging.info("Copied directory from %s to %s", from_to[0], from_to[1])
 
     # Standardise the destination directory structure.
@@ -349,35 +470,33 @@ def standardise_output_dirs(output_subdir: str) -> None:
 
     # Iterate over the list of subdirectories.
     for subdir in subdirs:
+        mpat = constants.COMBINED_DIR_PATTERN.search(subdir)
+        if not mpat:
+            continue
+
         # if a 'SERVICE' or 'MASTER' pattern matches,
         # remove the last subdirectory.
-        if (
-            constants.SERVICE_PATTERN.search(subdir)
-            or constants.SERVICE_SUBDAY_PATTERN.search(subdir)
-            or constants.MASTER_PATTERN.search(subdir)
-            or constants.MASTER_SUBDAY_PATTERN.search(subdir)
-        ):
+        if mpat.lastgroup == "dated":
             remove_last_subdir(subdir)
 
-        # If a 'SUBDAY' pattern matches, rename the 'subday' directory.
-        if constants.SERVICE_SUBDAY_PATTERN.search(
-            subdir
-        ) or constants.MASTER_SUBDAY_PATTERN.search(subdir):
-            remove_subday_subdir(subdir)
+            # If a 'SUBDAY' pattern matches, rename the 'subday' directory.
+            if mpat.group(constants.DATED_GROUP_SUBDAY):
+                remove_subday_subdir(subdir)
 
         # No standardisation needed in the case of lsidyv files.
-        if constants.LSIDYV_PATTERN.search(subdir):
+        if mpat.lastgroup == "lsidyv":
             raise NotImplementedError(
                 "Standardisation of 'LSIDYV' directories implemented"
             )
 
-    # Check that the new subdirectory structure is standard.
-    unique_leaf_subdirs = list(
-        set(os.path.dirname(f) for f in utils.list_files(output_subdir))
-    )
-    for subdir in unique_leaf_subdirs:
-        if not constants.STANDARD_SUBDIR_PATTERN.search(subdir):
-            msg = f"Failed to standardise output subdirectory: {subdir}"
+    # Check that the new subdirectory structure is standard. The leaf
+    # subdirectories (those containing files) are found by walking the
+    # restructured tree, since directories may have been renamed along the
+    # way.
+    for dirpath, filenames in utils.walk_files(output_subdir):
+        leaf_subdir = os.path.normpath(dirpath)
+        if filenames and not constants.STANDARD_SUBDIR_PATTERN.search(leaf_subdir):
+            msg = f"Failed to standardise output subdirectory: {leaf_subdir}"
             raise RuntimeError(msg)
     logging.info("Standardised output directory %s", output_subdir)
 
@@ -430,8 +549,7 @@ def remove_subday_subdir(path: str) -> None:
 
     # Make sure the last-but-one subdirectory matches the expected pattern.
     subscript_dir_path = os.path.dirname(path)
-    subday_pattern = re.compile(constants.P_SUBDAY + "$", re.IGNORECASE)
-    if not subday_pattern.search(subscript_dir_path):
+    if not constants.SUBDAY_END_PATTERN.search(subscript_dir_path):
         msg = f"Failed to match subscripted subdirectory:\n{subscript_dir_path}"
         raise ValueError(msg)
 
@@ -441,28 +559,14 @@ def remove_subday_subdir(path: str) -> None:
     utils.move_from_to(from_dir=subscript_dir_path, to_dir=to_dir)
 
 
-def target_output_subdir(full_path: str, len_subdir: int, output_dir: str) -> str:
-    """Construct the path to an output subdirectory. The subdirectory depth is
-    determined by the len_subdir argument.
-
-    Args:
-        full_path (str): The full path to a JISC newspaper file.
-        len_subdir (int): The number of chars in the output subdirectory
-                          path after the output directory.
-        output_dir (str): The output directory.
-
-    Returns:
-        str: The output directory.
-    """
-    subdir = standardised_output_subdir(full_path)[:len_subdir]
-    return os.path.join(output_dir, subdir)
-
-
-def standardised_output_subdir(full_path: str) -> str:
+def standardised_output_subdir(full_path: str, mpat: Union[Match, None] = None) -> str:
     """Determine the standardised output subdirectory for a given full path.
 
     Args:
         full_path (str): The full path to a JISC newspaper file.
+        mpat (Match, optional): The match of the combined directory pattern in
+                                the full path, if already searched for.
+                                Defaults to None.
 
     Raises:
         RuntimeError: When no match is found.
@@ -470,19 +574,22 @@ def standardised_output_subdir(full_path: str) -> str:
     Returns:
         str: The standardised path.
     """
-    # Loop over the directory pattens.
-    for pattern in constants.DIR_PATTERNS:
-        # If the directory pattern matches, extract the standardised path.
-        searched_pattern = pattern.search(full_path)
-        if searched_pattern:
-            if pattern == constants.LSIDYV_PATTERN:
-                # Handle the lsidvy pattern by inspecting the filename.
-                filename = os.path.basename(full_path)
-                title_code, year, month = filename.split("-")[:3]
-                day = filename.split("-")[-1].split(".")[0][: constants.LEN_DAY]
-                return os.path.join(title_code.upper(), year, month, day, "")
-
-            return (searched_pattern.group(1) + searched_pattern.group(2)).upper()
+    # If a directory pattern matches, extract the standardised path.
+    if mpat is None:
+        mpat = constants.COMBINED_DIR_PATTERN.search(full_path)
+    if mpat and mpat.lastgroup == "lsidyv":
+        # Handle the lsidvy pattern by inspecting the filename.
+        fields = os.path.basename(full_path).split("-")
+        title_code, year, month = fields[:3]
+        day = fields[-1].split(".")[0][: constants.LEN_DAY]
+        sep = os.sep
+        return f"{title_code.upper()}{sep}{year}{sep}{month}{sep}{day}{sep}"
+
+    if mpat and mpat.lastgroup == "dated":
+        return (
+            mpat.group(constants.DATED_GROUP_SUBDIR)
+            + mpat.group(constants.DATED_GROUP_SEP)
+        ).upper()
 
     # If no match is found, raise an error.
     msg = f"Failed to compute a standardisation for the full path: {full_path}"
@@ -504,22 +611,46 @@ def extract_file_path_stubs(
                                  Defaults to False.
 
     Raises:
-        RuntimeError: The lengths of stubs and paths do not match.
+        RuntimeError: If any of the paths do not match a directory pattern.
 
     Returns:
         list: stubs.
     """
 
-    stubs = utils.flatten(
-        [extract_pattern_stubs(p, paths) for p in constants.DIR_PATTERNS]
-    )
+    # Match each path against all of the directory patterns in a single pass.
+    # (Names used in the loop are bound locally to avoid repeated lookups.)
+    stubs = []
+    unmatched = []
+    counts = dict.fromkeys(constants.DIR_PATTERN_NAMES, 0)
+    search = constants.COMBINED_DIR_PATTERN.search
+    len_title_code = constants.LEN_TITLE_CODE
+    # Many files share a stub, so intern them to keep one copy of each.
+    intern = sys.intern
+    for path in paths:
+        mpat = search(path)
+        if not mpat:
+            unmatched.append(path)
+            continue
+        name = dir_pattern_name(mpat)
+        counts[name] += 1
+        if name == "lsidyv":
+            # Handle the lsidyv pattern.
+            stubs.append(intern(path[0 : mpat.end()]))
+        else:
+            # Match on the directory pattern (title code & subdirectories
+            # thereof) but extract only the initial part of the path (up to &
+            # including the title code).
+            stubs.append(intern(path[0 : mpat.start() + len_title_code]))
+
+    for name, count in counts.items():
+        logging.info("Found %s files matching the %s pattern.", count, name)
 
     # Check all files were matched against the known directory patterns.
-    if len(paths) != len(stubs):
+    if unmatched:
         # Write the unmatched full paths to a file in the working directory.
-        utils.write_unmatched_file(paths, working_dir)
-        msg = f"Matched only {len(stubs)} directory patterns out of"
-        msg = f"{msg} {len(paths)} files. See the {constants.NAME_UNMATCHED_FILE} file."
+        utils.write_unmatched_file(unmatched, working_dir)
+        msg = f"{len(unmatched)} of {len(paths)} files did not match any directory"
+        msg = f"{msg} pattern. See the {constants.NAME_UNMATCHED_FILE} file."
         raise RuntimeError(msg)
 
     if sort_them:
@@ -527,62 +658,66 @@ def extract_file_path_stubs(
     return stubs
 
 
-def extract_pattern_stubs(pattern: Pattern, paths: list) -> list:
-    """Construct a list of file path stubs for a given directory pattern.
-
-    The 'stub' is the initial part of the path, up to & including the title
-    code.
+def dir_pattern_name(mpat: Match) -> str:
+    """Name the directory pattern matched by the combined directory pattern.
 
     Args:
-        pattern (Pattern): The pattern to search for.
-        paths (list): A list of paths to search.
+        mpat (Match): A match of the combined directory pattern.
 
     Returns:
-        list: stubs for each of the given paths.
+        str: One of the names in constants.DIR_PATTERN_NAMES.
     """
-
-    if pattern == constants.LSIDYV_PATTERN:
-        # Handle the lsidyv pattern.
-        ret = [str[0 : mpat.end()] for str in paths if (mpat := pattern.search(str))]
-    else:
-        # Match on the directory pattern (title code & subdirectories thereof)
-        # but extract only the initial part of the path (up to & including the
-        # title code).
-        ret = [
-            str[0 : mpat.start() + constants.LEN_TITLE_CODE]
-            for str in paths
-            if (mpat := pattern.search(str))
-        ]
-
-    logging.info("Found %s files matching the %s pattern.", len(ret), pattern)
-    return ret
+    if mpat.lastgroup != "dated":
+        return str(mpat.lastgroup)
+    name = mpat.group(constants.DATED_GROUP_KIND).lower()
+    if mpat.group(constants.DATED_GROUP_SUBDAY):
+        name += "_subday"
+    return name
 
 
-def fix_anomalous_title_codes(paths: list, working_dir: str) -> None:
+def fix_anomalous_title_codes(
+    paths: list, working_dir: str, max_workers: int = 1
+) -> None:
     """Correct the anomalous title codes in list and on disk.
 
     Args:
         paths (list): A list of paths to search.
         working_dir (str): The working directory.
+        max_workers (int, optional): Number of threads with which to copy the
+                                     anomalous files. Defaults to 1.
     """
 
-    count = 0
+    # Only lsidyv paths can be anomalous, so the pattern need only be searched
+    # for in paths containing the (literal) lsidyv prefix.
+    new_paths = {}  # type: Dict[int, str]
     for index, path in enumerate(paths):
+        if constants.LSIDYV_PREFIX not in path:
+            continue
         if constants.LISIDYV_ANOMALY_PATTERN.search(path):
             # Correct the title code anomaly.
-            new_path = fix_title_code_anomaly(path, working_dir)
+            new_paths[index] = fix_title_code_anomaly(path, working_dir)
+
+    # Map each corrected path to the anomalous file to be copied there. Where
+    # more than one file is corrected to the same path, the last one is kept
+    # (as it would be were they copied in turn).
+    copies = {new_path: paths[index] for index, new_path in new_paths.items()}
 
-            # Copy the anomalous file to the working directory.
-            Path(os.path.dirname(new_path)).mkdir(parents=True, exist_ok=True)
-            copy(path, new_path)
+    def copy_anomalous_file(new_path: str) -> None:
+        # Copy the anomalous file to the working directory.
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        copy(copies[new_path], new_path)
+        logging.debug("Copied anomalous path %s to %s", copies[new_path], new_path)
 
-            # Update the paths list element to refer to the copied file.
-            paths[index] = new_path
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Consume the results so any exception is raised here.
+        for _ in executor.map(copy_anomalous_file, copies):
+            pass
 
-            logging.debug("Copied anomalous path %s to %s", path, new_path)
-            count += 1
+    # Update the paths list elements to refer to the copied files.
+    for index, new_path in new_paths.items():
+        paths[index] = new_path
 
-    logging.info("Fixed %s anomalous paths.", count)
+    logging.info("Fixed %s anomalous paths.", len(new_paths))
 
 
 def fix_title_code_anomaly(path: str, working_dir: str) -> str:
@@ -684,6 +819,22 @@ def parse_args() -> argparse.Namespace:
         help="Working directory to which temporary & log files are written",
     )
 
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=constants.STUB_MAX_WORKERS,
+        help="Number of worker threads with which to process the title codes",
+    )
+
+    parser.add_argument(
+        "--link-mode",
+        choices=constants.LINK_MODES,
+        default="copy",
+        help="How to write files to the output directory: copy them, copy them "
+        "with copy-on-write where the filesystem supports it (reflink), or hard "
+        "link them to the input files (hardlink)",
+    )
+
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -727,20 +878,19 @@ def setup_directories(args: argparse.Namespace) -> None:
     """
 
     # Check the input directory path exists.
-    if not os.path.exists(args.input_dir):
+    if not os.path.isdir(args.input_dir):
         raise ValueError("Please provide a valid input directory")
 
     # Prepare the output directory.
-    if not os.path.exists(args.output_dir):
-        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
 
     # Create a timestamped working subdirectory.
     working_subdir = (
         f'{constants.FILENAME_PREFIX}{datetime.now().strftime("%Y-%m-%d_%Hh-%Mm-%Ss")}'
     )
     working_dir = os.path.join(args.working_dir, working_subdir)
-    if not os.path.exists(working_dir):
-        Path(working_dir).mkdir(parents=True, exist_ok=True)
+    if not os.path.isdir(working_dir):
+        os.makedirs(working_dir, exist_ok=True)
         # Set the working_dir argument to the timestamped subdirectory.
         args.working_dir = working_dir
 
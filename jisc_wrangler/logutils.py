@@ -7,8 +7,12 @@ Functions to help logging used across modules.
 import argparse
 import inspect
 import logging
+import multiprocessing
 import os
+from contextlib import contextmanager
 from importlib import metadata
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Union
 
 
 def setup_logging(args: argparse.Namespace, logfilename: str) -> None:
@@ -40,3 +44,53 @@ def setup_logging(args: argparse.Namespace, logfilename: str) -> None:
         logging.info("Executing a DRY RUN. No files will be copied.")
 
     print(f"Logging to the working directory at: {log_full_path}")
+
+
+@contextmanager
+def queue_logging(
+    processes: bool = True,
+) -> Iterator[Union[multiprocessing.Queue, None]]:
+    """Forward log records from worker processes to this process's handlers.
+
+    Records put on the yielded queue (see setup_worker_logging) are written
+    by a single listener thread, so worker processes never contend for the
+    log file. Worker threads log directly to this process's handlers, so
+    need neither the queue nor the listener.
+
+    Args:
+        processes (bool, optional): Whether the workers are processes (rather
+                                    than threads). Defaults to True.
+
+    Yields:
+        multiprocessing.Queue: The queue to pass to the worker processes, or
+                               None if the workers are threads.
+    """
+    if not processes:
+        yield None
+        return
+
+    log_queue = multiprocessing.Queue(-1)  # type: multiprocessing.Queue
+    listener = QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+    try:
+        yield log_queue
+    finally:
+        listener.stop()
+        log_queue.close()
+
+
+def setup_worker_logging(log_queue: multiprocessing.Queue, level: int) -> None:
+    """Send this (worker) process's log records to a queue.
+
+    Args:
+        log_queue (multiprocessing.Queue): The queue yielded by queue_logging.
+        level (int): The logging level.
+    """
+    root = logging.getLogger()
+    # Drop any handlers inherited from the parent process.
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
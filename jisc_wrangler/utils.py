@@ -4,46 +4,198 @@ JISC utility functions
 utility functions used across the JISC wrangler package
 """
 
+import hashlib
 import logging
+import mmap
 import os
-from datetime import datetime
-from hashlib import md5
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache, partial
 from pathlib import Path
-from shutil import move
-from typing import Union
+from shutil import copy, copy2, copymode, move
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, TextIO, Tuple, Union
 
 from jisc_wrangler import constants
 
+# Files opened by append_line, by path (which may be called from several
+# threads).
+_APPENDED_FILES = {}  # type: Dict[str, TextIO]
+_APPENDED_FILES_LOCK = threading.Lock()
 
-def flatten(nested_list: list) -> list:
-    """Flatten a list of lists.
+
+def scan_dir(dirpath: str) -> Union[Tuple[List[str], List[str]], None]:
+    """List the subdirectories and files in a single directory.
+
+    Symbolic links to directories are not followed.
 
     Args:
-        nested_list (list): nested list to flatten.
+        dirpath (str): Directory to scan.
 
     Returns:
-        list: The flattened list.
+        tuple: The paths of the subdirectories and the names of the files, or
+               None if the directory cannot be read.
+    """
+    subdirs = []
+    filenames = []
+    try:
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    filenames.append(entry.name)
+    except OSError:
+        return None
+    return subdirs, filenames
+
+
+def walk_files(directory: str) -> Iterator[Tuple[str, List[str]]]:
+    """Walk a directory tree, listing the names of the files in each directory.
+
+    Directories are visited depth first, each before its subdirectories,
+    which are visited in the order they are listed. Symbolic links to
+    directories are not followed and, as with Path.rglob, directories that
+    cannot be read (including a missing top-level directory) are skipped.
+
+    Args:
+        directory (str): Directory to walk.
+
+    Yields:
+        tuple: The path of each directory and the names of the files in it.
+    """
+    stack = [directory]
+    while stack:
+        dirpath = stack.pop()
+        scanned = scan_dir(dirpath)
+        if scanned is None:
+            continue
+        subdirs, filenames = scanned
+        yield dirpath, filenames
+        stack.extend(reversed(subdirs))
+
+
+def walk_files_threaded(
+    directory: str,
+    max_workers: int,
+    min_dirs: int = constants.WALK_THREADED_MIN_DIRS,
+) -> Iterator[Tuple[str, List[str]]]:
+    """Walk a directory tree as walk_files does, but scan the directories in a
+    pool of threads.
+
+    The scans are I/O-bound (the GIL is released while reading directories),
+    so on high-latency storage many directories can be read at once.
+    Directories are yielded in the order their scans complete, which is
+    unspecified. The directories are scanned in the calling thread until
+    min_dirs of them have been found, so a small tree is walked without
+    starting the pool at all.
+
+    Args:
+        directory (str): Directory to walk.
+        max_workers (int): The number of threads.
+        min_dirs (int, optional): The number of directories to find before
+                                  starting the pool. Defaults to
+                                  constants.WALK_THREADED_MIN_DIRS.
+
+    Yields:
+        tuple: The path of each directory and the names of the files in it.
+    """
+    # Scan breadth first, so the pool (if needed) starts with many
+    # directories to scan.
+    queue = deque([directory])
+    num_dirs = 1
+    while queue and num_dirs < min_dirs:
+        dirpath = queue.popleft()
+        scanned = scan_dir(dirpath)
+        if scanned is None:
+            continue
+        subdirs, filenames = scanned
+        queue.extend(subdirs)
+        num_dirs += len(subdirs)
+        yield dirpath, filenames
+    if not queue:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(scan_dir, dirpath): dirpath for dirpath in queue}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dirpath = pending.pop(future)
+                scanned = future.result()
+                if scanned is None:
+                    continue
+                subdirs, filenames = scanned
+                for subdir in subdirs:
+                    pending[executor.submit(scan_dir, subdir)] = subdir
+                yield dirpath, filenames
+
+
+def iter_files(directory: str, suffix: str = "") -> Iterator[str]:
+    """Iterate over all files under a given directory with a given suffix,
+    recursively.
+
+    Each directory's files are yielded before those of its subdirectories
+    (see walk_files).
+
+    Args:
+        directory (str): Directory to check.
+        suffix (str, optional): file suffix to filter. Defaults to "".
+
+    Yields:
+        str: Paths of files in the target directory.
     """
-    return [item for sublist in nested_list for item in sublist]
+    for dirpath, filenames in walk_files(directory):
+        for filename in filenames:
+            if filename.endswith(suffix):
+                yield os.path.join(dirpath, filename)
 
 
-def list_files(directory: str, suffix: str = "", sort_them: bool = False) -> list:
+def list_files(
+    directory: str, suffix: str = "", sort_them: bool = False, max_workers: int = 1
+) -> list:
     """List all files under a given directory with a given suffix, recursively.
 
     Args:
         directory (str): Directory to check.
         suffix (str, optional): file suffix to filter. Defaults to "".
         sort_them (bool, optional): Whether to sort the results. Defaults to False.
+        max_workers (int, optional): The number of threads with which to walk
+                                  the directory tree (see walk_files_threaded).
+                                  If more than one, the unsorted results are in
+                                  no particular order. Defaults to 1.
 
     Returns:
         list: Files in the target directory.
     """
-    ret = [str(f) for f in Path(directory).rglob("*" + suffix) if os.path.isfile(f)]
+    if max_workers > 1:
+        ret = [
+            os.path.join(dirpath, filename)
+            for dirpath, filenames in walk_files_threaded(directory, max_workers)
+            for filename in filenames
+            if filename.endswith(suffix)
+        ]
+    else:
+        ret = list(iter_files(directory, suffix))
     if sort_them:
         ret.sort()
     return ret
 
 
+def count_files(directory: str, suffix: str = "") -> int:
+    """Count all files under a given directory with a given suffix, recursively,
+    without building a list of them.
+
+    Args:
+        directory (str): Directory to check.
+        suffix (str, optional): file suffix to filter. Defaults to "".
+
+    Returns:
+        int: File count.
+    """
+    return sum(1 for _ in iter_files(directory, suffix))
+
+
 def count_lines(file: str) -> int:
     """Count the number of lines in a file or file-like object.
 
@@ -55,8 +207,16 @@ def count_lines(file: str) -> int:
     """
     if not os.path.isfile(file):
         return 0
-    with open(file, "r", encoding="utf-8") as openfile:
-        ret = sum(1 for _ in openfile.readlines())
+    # Count newlines in binary blocks, without decoding or splitting the file.
+    # As with readlines, a final line without a newline is counted too.
+    ret = 0
+    last = b"\n"
+    with open(file, "rb") as openfile:
+        for buf in iter(partial(openfile.read, constants.READ_BUFFER_SIZE), b""):
+            ret += buf.count(b"\n")
+            last = buf[-1:]
+    if last != b"\n":
+        ret += 1
     return ret
 
 
@@ -72,75 +232,205 @@ def count_all_files(directory: str, description: Union[str, None] = None) -> int
         int: File count.
     """
 
-    ret = len(list_files(directory))
+    ret = count_files(directory)
     if description:
         logging.info("Counted %s files under the %s directory.", ret, description)
     return ret
 
 
-def count_matches_in_list(prefix: str, str_list: list) -> int:
+def count_matches_in_list(prefix: str, str_list: list, start: int = 0) -> int:
     """Count how many strings, at the start of a list, begin with a given prefix.
 
+    The end of the initial run of matches is found by a galloping (exponential
+    then binary) search, in O(log n) comparisons for a run of length n. This
+    relies on the matching strings forming a single run at the start of the
+    list, as they do in a sorted list whose first string begins with the
+    prefix: strings after the first non-match are not checked.
+
     Args:
         prefix (str): Prefix to check.
         str_list (list): List of strings to check.
+        start (int, optional): Index at which the list is taken to start, so
+                               the list need not be sliced. Defaults to 0.
 
     Returns:
         int: String with prefix count.
     """
 
-    if len(str_list) == 0:
+    num_strs = len(str_list)
+    if num_strs <= start:
         logging.warning("Empty list passed to 'count_matches_in_list'")
         return 0
 
-    i = 0
-    while i != len(str_list) and str_list[i].startswith(prefix):
-        i += 1
-    return i
-
+    if not str_list[start].startswith(prefix):
+        return 0
 
-def remove_duplicates(strs: list, sort_them=False) -> list:
-    """Remove duplicates from a list.
+    # Gallop: double the step until a non-match (or the end) is reached,
+    # keeping lo at a match.
+    lo, step = start, 1
+    hi = start + 1
+    while hi < num_strs and str_list[hi].startswith(prefix):
+        lo = hi
+        step *= 2
+        hi = lo + step
+    hi = min(hi, num_strs)
+
+    # Binary search for the first non-match between lo and hi.
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if str_list[mid].startswith(prefix):
+            lo = mid
+        else:
+            hi = mid
+    return hi - start
+
+
+def hash_file(
+    path: str,
+    blocksize: int = constants.HASH_BLOCKSIZE,
+    algorithm: str = constants.HASH_ALGORITHM,
+    limit: Union[int, None] = None,
+) -> str:
+    """Calculate the hash of a given file
 
     Args:
-        strs (list): List of strings.
-        sort_them (bool, optional): Whether to sort the unique strings.
-                                 Defaults to False.
+        path (str): Path to the file to be hashed.
+        blocksize (int, optional): Memory size to read in the file.
+                                   Defaults to constants.HASH_BLOCKSIZE.
+        algorithm (str, optional): Name of the hashlib algorithm to use.
+                                   Defaults to constants.HASH_ALGORITHM.
+        limit (int, optional): If given, hash only (at most) this many bytes
+                               from the start of the file. Defaults to None.
 
     Returns:
-        list: _description_
+        str: The HEX digest hash of the given file
     """
 
-    unique_strs = list(set(strs))
+    # Hashes are cached by the file's modification time & size (as well as
+    # its path), so a file that has since changed is hashed again.
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_mtime_ns, stat.st_size, blocksize, algorithm, limit)
+
+
+@lru_cache(maxsize=constants.HASH_CACHE_SIZE)
+def _hash_file(
+    path: str,
+    mtime_ns: int,  # pylint: disable=unused-argument
+    size: int,  # pylint: disable=unused-argument
+    blocksize: int,
+    algorithm: str,
+    limit: Union[int, None],
+) -> str:
+    """Calculate the hash of a given file (see hash_file).
+
+    The modification time and size of the file are not used, other than as
+    part of the cache key.
+    """
 
-    if sort_them:
-        unique_strs.sort()
-    return unique_strs
+    # Instatiate the hashlib module with the given algorithm
+    hasher = hashlib.new(algorithm)
 
+    # Open the file and instatiate the buffer
+    with open(path, "rb") as openfile:
+        # Hash a whole (not too large) file in one call on a memory map of it.
+        if limit is None and _hash_mapped_file(openfile, hasher):
+            return hasher.hexdigest()
 
-def hash_file(path: str, blocksize: int = 65536) -> str:
-    """Calculate the MD5 hash of a given file
+        remaining = limit
+        buf = openfile.read(blocksize if limit is None else min(blocksize, limit))
+        # Continue to read in the file in blocks
+        while len(buf) > 0:
+            hasher.update(buf)  # Update the hash
+            if remaining is not None:
+                remaining -= len(buf)
+                if remaining <= 0:
+                    break
+                blocksize = min(blocksize, remaining)
+            buf = openfile.read(blocksize)  # Update the buffer
+
+    return hasher.hexdigest()
+
+
+def _hash_mapped_file(openfile: BinaryIO, hasher: Any) -> bool:
+    """Update a hash with the contents of an open file via a memory map.
 
     Args:
-        path (str): Path to the file to be hashed.
-        blocksize (int, optional): Memory size to read in the file. Defaults to 65536.
+        openfile (BinaryIO): The file, opened for reading in binary mode.
+        hasher (Any): The hashlib hash object to update.
 
     Returns:
-        str: The HEX digest hash of the given file
+        bool: Whether the hash was updated. It is not if the file is empty,
+              larger than constants.HASH_MMAP_MAX_SIZE or cannot be mapped.
     """
+    try:
+        size = os.fstat(openfile.fileno()).st_size
+        if size == 0 or size > constants.HASH_MMAP_MAX_SIZE:
+            return False
+        with mmap.mmap(openfile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mapped)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def hash_files(paths: list, limit: Union[int, None] = None) -> list:
+    """Calculate the hashes of several files concurrently.
+
+    Each file is hashed by hash_file in its own thread, so that reading one
+    file overlaps with reading and hashing the others. If there is at most one
+    block (constants.HASH_BLOCKSIZE bytes) to hash from each file, the files
+    are hashed in turn instead, as starting the threads would cost more than
+    it saves.
 
-    # Instatiate the hashlib module with md5
-    hasher = md5()
+    Args:
+        paths (list): Paths to the files to be hashed.
+        limit (int, optional): If given, hash only (at most) this many bytes
+                               from the start of each file. Defaults to None.
 
-    # Open the file and instatiate the buffer
-    with open(path, "rb", encoding="utf-8") as openfile:
-        buf = openfile.read(blocksize)
-        # Continue to read in the file in blocks
-        while len(buf) > 0:
-            hasher.update(buf)  # Update the hash
-            buf = openfile.read(blocksize)  # Update the buffer
+    Returns:
+        list: The HEX digest hashes of the given files, in the same order.
+    """
+    hash_one = partial(hash_file, limit=limit)
+    if (
+        len(paths) < 2
+        or (limit is not None and limit <= constants.HASH_BLOCKSIZE)
+        or all(os.path.getsize(path) <= constants.HASH_BLOCKSIZE for path in paths)
+    ):
+        return [hash_one(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        return list(executor.map(hash_one, paths))
 
-    return hasher.hexdigest()
+
+def same_file_contents(path1: str, path2: str) -> bool:
+    """Check whether two files have the same contents, by comparing hashes.
+
+    Files of different sizes are distinct, and most distinct files of the
+    same size differ near the start, so the first block of each file
+    (constants.HASH_BLOCKSIZE bytes) is hashed before the files are hashed in
+    full. The comparison stops as soon as a difference is found.
+
+    Args:
+        path1 (str): Path to the first file.
+        path2 (str): Path to the second file.
+
+    Returns:
+        bool: Whether the files have the same contents.
+    """
+    size = os.path.getsize(path1)
+    if size != os.path.getsize(path2):
+        return False
+
+    head1, head2 = hash_files([path1, path2], limit=constants.HASH_BLOCKSIZE)
+    if head1 != head2:
+        return False
+    if size <= constants.HASH_BLOCKSIZE:
+        return True
+
+    hash1, hash2 = hash_files([path1, path2])
+    return hash1 == hash2
 
 
 def alt_output_file(file_path: str) -> str:
@@ -156,6 +446,108 @@ def alt_output_file(file_path: str) -> str:
     return file_path + constants.ALT_FILENAME_SUFFIX + extension
 
 
+def kernel_copy(src: str, dst: str) -> None:
+    """Copy a file without passing its contents through user space.
+
+    Uses os.copy_file_range where available (which also allows copy-on-write
+    filesystems to share the data blocks), otherwise falls back to
+    shutil.copy.
+
+    Args:
+        src (str): The path to the source file.
+        dst (str): The path to the destination file.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            copymode(src, dst)
+            return
+        except OSError:
+            pass
+    copy(src, dst)
+
+
+def fast_copy(src: str, dst: str) -> None:
+    """Make a file available at a new path as cheaply as possible.
+
+    Hard links the file if the source and destination are on the same
+    filesystem (and the filesystem allows it), otherwise copies it with
+    kernel_copy.
+
+    Note that a hard link shares its contents with the source file, so
+    modifying the destination in place also modifies the source. Only use
+    this for files that are treated as read-only. For the same reason, an
+    existing destination file (which may itself be a hard link to another
+    file) is never written into, but is replaced.
+
+    Args:
+        src (str): The path to the source file.
+        dst (str): The path to the destination file.
+    """
+    try:
+        _link_or_copy(src, dst)
+        return
+    except FileExistsError:
+        pass
+
+    # Link (or copy) the file to a temporary path alongside the destination,
+    # and rename that over the destination.
+    temp = f"{dst}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        _link_or_copy(src, temp)
+        os.replace(temp, dst)
+    finally:
+        # The temporary path remains if the replace failed, or if the
+        # destination was already a hard link to the source.
+        if os.path.lexists(temp):
+            os.remove(temp)
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    # Hard link, or copy where that is not possible. Raises FileExistsError if
+    # the destination exists.
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in constants.LINK_FALLBACK_ERRNOS:
+            raise
+        kernel_copy(src, dst)
+
+
+def copy_function(
+    link_mode: str, preserve_times: bool = False
+) -> Callable[[str, str], object]:
+    """Get the function with which to write files in a given link mode.
+
+    Args:
+        link_mode (str): One of constants.LINK_MODES.
+        preserve_times (bool, optional): Whether copies (in the "copy" link
+                                         mode) keep the access & modification
+                                         times of the source file, as with
+                                         shutil.copy2 rather than shutil.copy.
+                                         Defaults to False.
+
+    Raises:
+        ValueError: If the link mode is not recognised.
+
+    Returns:
+        Callable: A function taking the source and destination file paths.
+    """
+    if link_mode == "copy":
+        return copy2 if preserve_times else copy
+    if link_mode == "reflink":
+        return kernel_copy
+    if link_mode == "hardlink":
+        return fast_copy
+    raise ValueError(f"Invalid link mode: {link_mode}.")
+
+
 def list_all_subdirs(directory: str) -> list:
     """List subdirectories in given directory.
 
@@ -165,11 +557,10 @@ def list_all_subdirs(directory: str) -> list:
     Returns:
         list: Subdirectories in dir.
     """
-    return [
-        os.path.join(str(d), "")
-        for d in Path(directory).rglob("*")
-        if not os.path.isfile(d)
-    ]
+    dirpaths = (dirpath for dirpath, _ in walk_files(directory))
+    # Skip the directory itself, which is walked first.
+    next(dirpaths, None)
+    return [os.path.join(dirpath, "") for dirpath in dirpaths]
 
 
 def move_from_to(from_dir: str, to_dir: str) -> None:
@@ -179,76 +570,118 @@ def move_from_to(from_dir: str, to_dir: str) -> None:
     Args:
         from_dir (str): The path to the source directory.
         to_dir (str): The path to the target directory.
+
+    Raises:
+        FileExistsError: If a file to be moved already exists in the target
+                         directory.
     """
 
-    # If the target directory does not already exist, create it.
+    # If the target directory does not already exist, then within a filesystem
+    # a source directory containing only files is simply renamed (a single
+    # syscall for all of its files). Otherwise the target directory is created
+    # (and the files in any nested subdirectories are moved into it too).
     if not os.path.exists(to_dir):
+        to_parent = os.path.dirname(os.path.abspath(to_dir))
+        scanned = scan_dir(from_dir)
+        if (
+            scanned is not None
+            and not scanned[0]
+            and os.stat(from_dir).st_dev == os.stat(to_parent).st_dev
+        ):
+            os.rename(from_dir, to_dir)
+            logging.debug("Renamed directory: %s to: %s", from_dir, to_dir)
+            return
         Path(to_dir).mkdir(parents=False, exist_ok=True)
         logging.info("Created subdirectory at %s", to_dir)
 
-    for files in list_files(from_dir):
-        move(files, to_dir)
+    # Within a filesystem, rename each file (a single syscall, with no copying).
+    # As with shutil.move, an existing file in the target is not overwritten.
+    same_device = os.stat(from_dir).st_dev == os.stat(to_dir).st_dev
+    for file in list_files(from_dir):
+        if not same_device:
+            move(file, to_dir)
+            continue
+        dst = os.path.join(to_dir, os.path.basename(file))
+        if os.path.exists(dst):
+            raise FileExistsError(f"Destination path {dst} already exists.")
+        os.rename(file, dst)
     logging.debug("Moved all files from: %s to: %s ", from_dir, to_dir)
     Path.rmdir(Path(from_dir).absolute())
     logging.debug("Removed directory: %s", from_dir)
 
 
-def write_unmatched_file(paths: list, working_dir: str) -> None:
+def write_unmatched_file(unmatched_paths: list, working_dir: str) -> None:
     """Write out a list of files that do not match any of the directory patterns.
 
+    The paths are not checked against the patterns again: they should already
+    have been found not to match (see extract_file_path_stubs).
+
     Args:
-        paths (list): Paths to check.
+        unmatched_paths (list): Paths that did not match.
         working_dir (str): Working directory.
     """
-    for pattern in constants.DIR_PATTERNS:
-        paths = [str for str in paths if not pattern.search(str)]
     unmatched_file = os.path.join(working_dir, constants.NAME_UNMATCHED_FILE)
-    with open(unmatched_file, "w", encoding="utf-8") as openfile:
-        for path in paths:
-            openfile.write(f"{path}\n")
+    with open(
+        unmatched_file, "w", encoding="utf-8", buffering=constants.WRITE_BUFFER_SIZE
+    ) as openfile:
+        openfile.write("".join(f"{path}\n" for path in unmatched_paths))
 
 
-def ignore_file(full_path: str, working_dir: str) -> None:
-    """Process a file that can be safely ignored.
+def append_line(path: str, line: str) -> None:
+    """Append a line to a file, keeping the file open for further lines.
+
+    Lines are written through a buffer (of constants.WRITE_BUFFER_SIZE bytes),
+    so close_appended_files must be called before the file is read.
 
     Args:
-        full_path (str): Full path to the file.
-        working_dir (str): Working directory.
+        path (str): Path to the file.
+        line (str): The line to append (without a newline).
     """
-    with open(
-        os.path.join(working_dir, constants.NAME_IGNORED_FILE), "a+", encoding="utf-8"
-    ) as openfile:
-        openfile.write(f"{full_path}\n")
-    logging.info("Added file %s to the ignored list.", full_path)
+    with _APPENDED_FILES_LOCK:
+        openfile = _APPENDED_FILES.get(path)
+        if openfile is None:
+            # The file stays open across calls, until close_appended_files.
+            openfile = open(  # pylint: disable=consider-using-with
+                path, "a+", encoding="utf-8", buffering=constants.WRITE_BUFFER_SIZE
+            )
+            _APPENDED_FILES[path] = openfile
+        openfile.write(f"{line}\n")
 
 
-def date_in_range(start: datetime, end: datetime, date: datetime) -> bool:
-    """Check if date is in the range [start, end].
+def close_appended_files() -> None:
+    """Close (and so flush) all of the files opened by append_line."""
+    with _APPENDED_FILES_LOCK:
+        for openfile in _APPENDED_FILES.values():
+            openfile.close()
+        _APPENDED_FILES.clear()
 
-    Args:
-        start (datetime): The start of the date range.
-        end (datetime): The end of the date range.
-        date (datetime): The date of interest.
 
-    Raises:
-        ValueError: If start is after end.
+def ignore_file(full_path: str, working_dir: str) -> None:
+    """Process a file that can be safely ignored.
 
-    Returns:
-        bool: Whether the date is within range..
+    Args:
+        full_path (str): Full path to the file.
+        working_dir (str): Working directory.
     """
+    append_line(os.path.join(working_dir, constants.NAME_IGNORED_FILE), full_path)
+    logging.info("Added file %s to the ignored list.", full_path)
 
-    if start > end:
-        raise ValueError(f"Invalid date interval. Start: {start}, End: {end}.")
-    return start <= date <= end
 
+@lru_cache(maxsize=constants.ISO_DATE_CACHE_SIZE)
+def parse_iso_date(date_str: str) -> Tuple[int, int, int]:
+    """Parse a date string in YYYY-MM-DD format.
 
-def parse_publicaton_date(date_str: str) -> tuple:
-    """Parse a date string seperated by '-'.
+    The same dates recur across many files, so parsed dates are cached.
 
     Args:
         date_str (str): string to extract date from.
 
+    Raises:
+        ValueError: If the date string is not in YYYY-MM-DD format.
+
     Returns:
-        tuple: Date split on '-'.
+        tuple: The (year, month, day) as integers.
     """
-    return tuple(date_str.split("-"))
+    if len(date_str) != 10 or date_str[4] != "-" or date_str[7] != "-":
+        raise ValueError(f"Invalid date: {date_str}.")
+    return (int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10]))
@@ -0,0 +1,18 @@
+import pytest
+
+from jisc_wrangler import constants
+from jisc_wrangler.jisc_alto2txt_wrangler import read_title_code_lookup_file
+
+
+@pytest.fixture(autouse=True, scope="session")
+def title_code_lookup_cache_dir(tmp_path_factory):
+    # Keep the cached title code lookup out of the user's cache directory.
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(
+            constants,
+            "TITLE_CODE_LOOKUP_CACHE_DIR",
+            str(tmp_path_factory.mktemp("cache")),
+        )
+        read_title_code_lookup_file.cache_clear()
+        yield
+    read_title_code_lookup_file.cache_clear()
@@ -1,9 +1,14 @@
+import argparse
+import pickle
+import time
 import xml.etree.ElementTree as ET
+from pathlib import Path
 
 import pytest
 
 from jisc_wrangler import constants
 from jisc_wrangler.jisc_alto2txt_wrangler import *
+from jisc_wrangler.jisc_alto2txt_wrangler import _make_title_code_to_nlp
 
 
 @pytest.fixture
@@ -99,6 +104,44 @@ def test_replace_publication_id(xml_tree):
     assert result == ("RDNP", "0000095")
 
 
+def test_replace_publication_id_bytes(xml_tree):
+    data = ET.tostring(xml_tree)
+    lookup = read_title_code_lookup_file()
+
+    title_code, nlp, result = replace_publication_id_bytes(data, lookup)
+
+    assert (title_code, nlp) == ("RDNP", "0000095")
+
+    # Only the publication id has changed.
+    assert result == data.replace(
+        b'<publication id="RDNP">', b'<publication id="0000095">'
+    )
+
+    # Non-standard title codes are left to the XML tree fallback.
+    data = data.replace(b'id="RDNP"', b'id="NCBL1023"')
+    assert replace_publication_id_bytes(data, lookup) is None
+
+    # As are files without an issue date.
+    data = ET.tostring(xml_tree).replace(b"<date>", b"<issue_date>")
+    assert replace_publication_id_bytes(data, lookup) is None
+
+    # Only the issue's own date is used, not any earlier date element.
+    data = ET.tostring(xml_tree).replace(
+        b"<title>", b"<date>1700-05-05</date><title>", 1
+    )
+    assert replace_publication_id_bytes(data, lookup)[:2] == ("RDNP", "0000095")
+
+    # An issue whose first child is not its date is left to the XML tree
+    # fallback.
+    data = ET.tostring(xml_tree).replace(b"<date>", b"<volume>1</volume><date>")
+    assert replace_publication_id_bytes(data, lookup) is None
+
+    # Dates outside the lookup table ranges raise an error.
+    data = ET.tostring(xml_tree).replace(b"1850-05-05", b"1700-05-05")
+    with pytest.raises(ValueError):
+        replace_publication_id_bytes(data, lookup)
+
+
 def test_standardise_title_code(nonstandard_xml_tree):
     # Initially the publication id is "NCBL1023"
     title_code = nonstandard_xml_tree.find(constants.PUPBLICATION_ELEMENT_NAME).attrib[
@@ -130,8 +173,8 @@ def test_read_title_code_lookup_file():
     assert isinstance(lookup["ANJO"][1][0], tuple)
     assert len(lookup["ANJO"][1][0]) == 2
 
-    assert lookup["ANJO"][1][0][0] == datetime.strptime("01-Jan-1800", "%d-%b-%Y")
-    assert lookup["ANJO"][1][0][1] == datetime.strptime("23-Aug-1876", "%d-%b-%Y")
+    assert lookup["ANJO"][1][0][0] == (1800, 1, 1)
+    assert lookup["ANJO"][1][0][1] == (1876, 8, 23)
 
     # This is the NLP code.
     assert isinstance(lookup["ANJO"][1][1], str)
@@ -151,141 +194,273 @@ def test_read_title_code_lookup_file():
     assert isinstance(lookup["SNSR"][0][0], tuple)
     assert len(lookup["SNSR"][0][0]) == 2
 
-    assert lookup["SNSR"][0][0][0] == datetime.strptime("19-Jan-1840", "%d-%b-%Y")
-    assert lookup["SNSR"][0][0][1] == datetime.strptime("12-Jul-1840", "%d-%b-%Y")
+    assert lookup["SNSR"][0][0][0] == (1840, 1, 19)
+    assert lookup["SNSR"][0][0][1] == (1840, 7, 12)
 
     # This is the NLP code.
     assert isinstance(lookup["SNSR"][0][1], str)
     assert lookup["SNSR"][0][1] == "0000097"
 
 
+def test_read_title_code_lookup_file_cache(tmp_path):
+    lookup_file = tmp_path / "title_code_lookup.csv"
+    cache_dir = tmp_path / "cache"
+    lookup_file.write_bytes(Path(constants.TITLE_CODE_LOOKUP_FILE).read_bytes())
+
+    # Bypass the in-memory cache to exercise the cache file.
+    read = read_title_code_lookup_file.__wrapped__
+    lookup = read(str(lookup_file), str(cache_dir))
+    (cache_file,) = cache_dir.iterdir()
+    assert cache_file.name.startswith("title_code_lookup-")
+    assert cache_file.suffix == constants.TITLE_CODE_LOOKUP_CACHE_SUFFIX
+    assert read(str(lookup_file), str(cache_dir)) == lookup
+    assert lookup == read_title_code_lookup_file()
+
+    # Nothing is written alongside the csv file.
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "cache",
+        "title_code_lookup.csv",
+    ]
+
+    # A cache file with a stale header, or of an older format, is ignored and
+    # rewritten.
+    with open(cache_file, "rb") as reader:
+        header = pickle.load(reader)
+    stale_headers = [
+        (header[0] - 1,) + header[1:],
+        header[:3] + (header[3] + 1,),
+        (0, {}),
+    ]
+    for stale_header in stale_headers:
+        cache_file.write_bytes(
+            pickle.dumps(stale_header) + pickle.dumps({"ANJO": "wrong shape"})
+        )
+        assert read(str(lookup_file), str(cache_dir)) == lookup
+        with open(cache_file, "rb") as reader:
+            assert pickle.load(reader) == header
+            assert pickle.load(reader) == lookup
+
+
+def test_title_code_to_nlp_overlapping_ranges(tmp_path):
+    lookup_file = tmp_path / "title_code_lookup.csv"
+    header = "Abbr | NLP | Start | | | End | |\n"
+
+    # One range contains a later-starting one, with the same NLP code.
+    lookup_file.write_text(
+        header
+        + "ABCD | 1 | 1 | Jan | 1800 | 31 | Dec | 1899\n"
+        + "ABCD | 1 | 1 | Jan | 1850 | 31 | Dec | 1850\n"
+    )
+    read = read_title_code_lookup_file.__wrapped__
+    lookup = read(str(lookup_file), str(tmp_path))
+    assert title_code_to_nlp("ABCD", (1850, 6, 1), lookup) == "0000001"
+    # A date after the inner range ends is still in the outer range.
+    assert title_code_to_nlp("ABCD", (1851, 1, 1), lookup) == "0000001"
+    assert title_code_to_nlp("ABCD", (1900, 1, 1), lookup) is None
+
+    # Overlapping ranges with different NLP codes are ambiguous.
+    lookup_file.write_text(
+        header
+        + "ABCD | 1 | 1 | Jan | 1800 | 31 | Dec | 1899\n"
+        + "ABCD | 2 | 1 | Jan | 1850 | 31 | Dec | 1850\n"
+    )
+    with pytest.raises(ValueError, match="Overlapping date ranges for title code ABCD"):
+        read(str(lookup_file), str(tmp_path / "cache"))
+
+
 def test_title_code_to_nlp():
     lookup = read_title_code_lookup_file()
 
     title_code = "ANJO"
-    year = "1876"
-    month = "08"
-    day = "22"
+    year = 1876
+    month = 8
+    day = 22
     expected = "0000031"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "ANJO"
-    year = "1876"
-    month = "08"
-    day = "24"
+    year = 1876
+    month = 8
+    day = 24
     expected = None
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "ANJO"
-    year = "1876"
-    month = "08"
-    day = "30"
+    year = 1876
+    month = 8
+    day = 30
     expected = "0000032"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "ANJO"
-    year = "1900"
-    month = "12"
-    day = "31"
+    year = 1900
+    month = 12
+    day = 31
     expected = "0000032"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "ANJO"
-    year = "1901"
-    month = "01"
-    day = "01"
+    year = 1901
+    month = 1
+    day = 1
     expected = None
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1803"
-    month = "07"
-    day = "01"
+    year = 1803
+    month = 7
+    day = 1
     expected = None
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1803"
-    month = "07"
-    day = "02"
+    year = 1803
+    month = 7
+    day = 2
     expected = "0000179"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1810"
-    month = "07"
-    day = "02"
+    year = 1810
+    month = 7
+    day = 2
     expected = None
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1811"
-    month = "03"
-    day = "16"
+    year = 1811
+    month = 3
+    day = 16
     expected = "0000177"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1835"
-    month = "08"
-    day = "29"
+    year = 1835
+    month = 8
+    day = 29
     expected = "0000177"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1835"
-    month = "09"
-    day = "29"
+    year = 1835
+    month = 9
+    day = 29
     expected = "0000178"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "COGE"
-    year = "1888"
-    month = "08"
-    day = "29"
+    year = 1888
+    month = 8
+    day = 29
     expected = "0000180"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "IPJO"
-    year = "1800"
-    month = "12"
-    day = "27"
+    year = 1800
+    month = 12
+    day = 27
     expected = "0000071"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "IPJL"
-    year = "1800"
-    month = "12"
-    day = "27"
+    year = 1800
+    month = 12
+    day = 27
     expected = "0000071"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "LAGE"
-    year = "1892"
-    month = "12"
-    day = "31"
+    year = 1892
+    month = 12
+    day = 31
     expected = "0000488"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
 
     title_code = "LAGER"
-    year = "1892"
-    month = "12"
-    day = "31"
+    year = 1892
+    month = 12
+    day = 31
     expected = "0000488"
 
-    assert title_code_to_nlp(title_code, year, month, day, lookup) == expected
+    assert title_code_to_nlp(title_code, (year, month, day), lookup) == expected
+
+
+def test_make_title_code_to_nlp():
+    lookup = read_title_code_lookup_file()
+    to_nlp = _make_title_code_to_nlp(lookup)
+
+    assert to_nlp("ANJO", (1876, 8, 22)) == "0000031"
+    assert to_nlp("ANJO", (1876, 8, 22)) == "0000031"
+    assert to_nlp("ANJO", (1876, 8, 24)) is None
+    assert to_nlp.cache_info().hits == 1
+    assert to_nlp.cache_info().misses == 2
+
+
+def test_process_inputs_failure(tmp_path, mocker):
+    metadata_files = [
+        (f"/input/{i}{constants.METADATA_XML_SUFFIX}", None) for i in range(8)
+    ]
+    mocker.patch(
+        "jisc_wrangler.jisc_alto2txt_wrangler.iter_metadata_files",
+        return_value=iter(metadata_files),
+    )
+    processed = []
+
+    def process_one(files, input_root, output_root, dry_run):
+        processed.append(files)
+        if files == metadata_files[0]:
+            raise RuntimeError("Failed to find plaintext file")
+        time.sleep(0.05)
+        return True, None
+
+    mocker.patch(
+        "jisc_wrangler.jisc_alto2txt_wrangler._process_one", side_effect=process_one
+    )
+    args = argparse.Namespace(
+        input_dir="/input",
+        output_dir=str(tmp_path),
+        dry_run=False,
+        threads=True,
+        jobs=1,
+    )
+    with pytest.raises(RuntimeError):
+        process_inputs(args)
+
+    # The remaining files are not processed after the failure (bar at most
+    # one, already started by the time the failure is seen).
+    assert processed[0] == metadata_files[0]
+    assert len(processed) <= 2
+
+
+def test_iter_metadata_files(fs):
+    fs.create_file("/home/input/ABCD/a_metadata.xml")
+    fs.create_file("/home/input/ABCD/a.txt")
+    fs.create_file("/home/input/ABCD/b_metadata.xml")
+    assert sorted(iter_metadata_files("/home/input/"), key=str) == [
+        ("/home/input/ABCD/a_metadata.xml", "/home/input/ABCD/a.txt"),
+        ("/home/input/ABCD/b_metadata.xml", None),
+    ]
+
+
+def test_count_metadata_files(fs):
+    fs.create_file("/home/input/ABCD/a_metadata.xml")
+    fs.create_file("/home/input/ABCD/a.txt")
+    fs.create_file("/home/input/EFGH/b_metadata.xml")
+    fs.create_file("/home/input/EFGH/b.txt")
+    fs.create_file("/home/input/EFGH/c.txt")
+    assert count_metadata_files("/home/input/") == (2, 3)
@@ -1,3 +1,5 @@
+import argparse
+import time
 from cmath import exp
 from unittest.mock import create_autospec
 
@@ -9,96 +11,187 @@ from jisc_wrangler.jisc_path_wrangler import *
 from .test_constants import *
 
 
-def test_extract_pattern_stubs():
-    # The first five paths match the P_SERVICE pattern.
-    actual = extract_pattern_stubs(constants.SERVICE_PATTERN, paths)
-    assert actual == stubs[:4]
+def test_is_known_dir(fs):
+    known_dirs = set()
+    assert not is_known_dir("/home/output/ABCD", known_dirs)
+    assert not known_dirs
+    fs.create_dir("/home/output/ABCD")
+    assert is_known_dir("/home/output/ABCD", known_dirs)
+    assert is_known_dir("/home/output/ABCD", None)
+    assert known_dirs == {"/home/output/ABCD"}
 
-    # The fifth path matches the P_SERVICE_SUBDAY pattern.
-    actual = extract_pattern_stubs(constants.SERVICE_SUBDAY_PATTERN, paths)
-    assert actual == stubs[4:5]
 
-    # The sixth & seventh paths match the P_LSIDYV pattern.
-    actual = extract_pattern_stubs(constants.LSIDYV_PATTERN, paths)
-    assert actual == stubs[5:7]
+def test_stub_title_code():
+    assert stub_title_code(stubs[0]) == "BDPO"
+    assert stub_title_code("/data/JISC/JISC2/lsidyv10001b/MOPT-") == "MOPT"
+    assert stub_title_code("/data/JISC/JISC2/WO1/lemr") == "LEMR"
 
-    # None of the paths matches the P_MASTER pattern.
-    actual = extract_pattern_stubs(constants.MASTER_PATTERN, paths)
-    assert actual == []
 
+def test_group_by_title_code():
+    # The anomalous file (second) has been corrected & copied to the working
+    # directory, so the files are no longer in order of their stubs.
+    working_dir = "/home/working_dir/"
+    files = [
+        "/data/JISC/JISC2/lsidyvfd9b/IMTS-1877-10-13_mets.xml",
+        working_dir + "lsidyvfd9d/IMTS-1877-10-13_mets.xml",
+        "/data/JISC/JISC3/B/WO1/ABCD/1850/01/02/service/WO1_ABCD_1850_01_02-0001.xml",
+        "/data/JISC/JISC3/A/WO1/ABCD/1850/01/02/service/WO1_ABCD_1850_01_02-0001.xml",
+        "/data/JISC/JISC3/A/WO1/ABCD/1850/01/01/service/WO1_ABCD_1850_01_01-0001.xml",
+    ]
+    actual = group_by_title_code(extract_file_path_stubs(files, working_dir), files)
+    assert actual == {
+        "IMTS": [
+            ("/data/JISC/JISC2/lsidyvfd9b/IMTS-", files[0:1]),
+            (working_dir + "lsidyvfd9d/IMTS-", files[1:2]),
+        ],
+        "ABCD": [
+            ("/data/JISC/JISC3/A/WO1/ABCD", [files[4], files[3]]),
+            ("/data/JISC/JISC3/B/WO1/ABCD", files[2:3]),
+        ],
+    }
+
+
+def test_process_inputs(tmp_path):
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    working_dir = tmp_path / "working_dir"
+    output_dir.mkdir()
+    working_dir.mkdir()
+
+    # An anomalous title code file conflicting with an existing one, and
+    # three conflicting copies of another file.
+    inputs = {
+        "JISC2/lsidyvfd9b/IMTS-1877-10-13_mets.xml": "h",
+        "JISC2/lsidyvfd9d/IMTSX-1877-10-13_mets.xml": "h2",
+        "JISC3/A/WO1/ABCD/1850/01/02/service/WO1_ABCD_1850_01_02-0001.xml": "x1",
+        "JISC3/B/WO1/ABCD/1850/01/02/service/WO1_ABCD_1850_01_02-0001.xml": "x2",
+        "JISC3/C/WO1/ABCD/1850/01/02/service/WO1_ABCD_1850_01_02-0001.xml": "x3",
+    }
+    for path, contents in inputs.items():
+        (input_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (input_dir / path).write_text(contents)
+
+    args = argparse.Namespace(
+        input_dir=str(input_dir),
+        output_dir=str(output_dir),
+        working_dir=str(working_dir),
+        jobs=4,
+        link_mode="copy",
+        dry_run=False,
+    )
+    try:
+        process_inputs(args)
+    finally:
+        utils.close_appended_files()
+
+    outputs = {
+        str(path.relative_to(output_dir)): path.read_text()
+        for path in output_dir.rglob("*")
+        if path.is_file()
+    }
+    # The first of each set of conflicting files (in order of their stubs) is
+    # written under its own name, and the last under the alternative name.
+    assert outputs == {
+        "IMTS/1877/10/13/IMTS-1877-10-13_mets.xml": "h",
+        "IMTS/1877/10/13/IMTS-1877-10-13_mets_ALT.xml": "h2",
+        "ABCD/1850/01/02/WO1_ABCD_1850_01_02-0001.xml": "x1",
+        "ABCD/1850/01/02/WO1_ABCD_1850_01_02-0001_ALT.xml": "x3",
+    }
+
+
+def test_process_inputs_failure(tmp_path, mocker):
+    input_dir = tmp_path / "input"
+    title_codes = ["ABCA", "ABCB", "ABCC", "ABCD", "ABCE"]
+    for title_code in title_codes:
+        path = input_dir / f"JISC3/A/WO1/{title_code}/1850/01/02/service"
+        path.mkdir(parents=True)
+        (path / f"WO1_{title_code}_1850_01_02-0001.xml").write_text("x")
+
+    processed = []
+
+    def process_stubs(runs, args):
+        title_code = stub_title_code(runs[0][0])
+        processed.append(title_code)
+        if title_code == title_codes[0]:
+            raise RuntimeError("Failed")
+        time.sleep(0.05)
+
+    mocker.patch(
+        "jisc_wrangler.jisc_path_wrangler.process_stubs", side_effect=process_stubs
+    )
+    args = argparse.Namespace(
+        input_dir=str(input_dir),
+        output_dir=str(tmp_path / "output"),
+        working_dir=str(tmp_path / "working_dir"),
+        jobs=1,
+        link_mode="copy",
+        dry_run=False,
+    )
+    with raises(RuntimeError):
+        process_inputs(args)
 
-def test_target_output_subdir():
-    output_dir = "/home/output/"
+    # The remaining title codes are not processed after the failure (bar at
+    # most one, already started by the time the failure is seen).
+    assert processed[0] == title_codes[0]
+    assert len(processed) <= 2
 
-    #
-    # Test with a full path matching the P_SERVICE pattern.
-    #
-    full_path = "/data/JISC/JISC1_VOL4_C1/042/0002_Job2001-final delivery  12$17$2006 at 2$48 PM/0001_$$Fileserver8$disk19$tape/2001-0274/Delivery/WO1/BDPO/1894/11/07/service/WO1_BDPO_1894_11_07-0008-054.xml"
 
-    # If the suffix length is that of the title code subdirectory, then the output
-    # target subdirectory is the output directory plus the title code directory.
-    len_subdir = len("ABCD/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir + "BDPO/"
+def test_dir_pattern_name():
+    expected = ["service"] * 4 + ["service_subday"] + ["lsidyv"] * 2
+    actual = [dir_pattern_name(constants.COMBINED_DIR_PATTERN.search(p)) for p in paths]
     assert actual == expected
 
-    # If the suffix length is that of the title code & year subdirectories, then
-    # the output target subdirectory is the output directory plus the title code
-    # and year directories.
-    len_subdir = len("ABCD/1999/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "BDPO/" + "1894/"
-
-    len_subdir = len("ABCD/1999/00/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "BDPO/" + "1894/" + "11/"
+    mpat = constants.COMBINED_DIR_PATTERN.search("/x/abcd/1850/01/02_v/Master/x.xml")
+    assert dir_pattern_name(mpat) == "master_subday"
+    mpat = constants.COMBINED_DIR_PATTERN.search("/x/OSMaps/foo/metadata.xml")
+    assert dir_pattern_name(mpat) == "os_maps"
 
-    len_subdir = len("ABCD/1999/00/00/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "BDPO/" + "1894/" + "11/" + "07/"
-
-    #
-    # Test with a full path matching the P_SERVICE_SUBDAY pattern.
-    #
-    full_path = "/data/JISC/JISC1/JISC2_VOL1_C0/097/2001-0346/WO1/LEMR/1873/01/04_S/service/WO1_LEMR_1873_01_04_S-0001.xml"
 
-    # If the suffix length is that of the title code subdirectory, then the output
-    # target subdirectory is the output directory plus the title code directory.
-    len_subdir = len("ABCD/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir + "LEMR/"
-    assert actual == expected
-
-    # If the suffix length is that of the title code & year subdirectories, then
-    # the output target subdirectory is the output directory plus the title code
-    # and year directories.
-    len_subdir = len("ABCD/1999/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "LEMR/" + "1873/"
-
-    len_subdir = len("ABCD/1999/00/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "LEMR/" + "1873/" + "01/"
-
-    len_subdir = len("ABCD/1999/00/00/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "LEMR/" + "1873/" + "01/" + "04/"
-
-    #
-    # Test with a full path matching the P_LSIDYV pattern.
-    #
-    full_path = "/data/JISC/JISC2/lsidyv100b3f/MOPT-1863-02-16.xml"
+def test_extract_file_path_stubs(fs):
+    working_dir = "/home/working/"
+    fs.create_dir(working_dir)
 
-    len_subdir = len("ABCD/1999/00/00/")
-    actual = target_output_subdir(full_path, len_subdir, output_dir)
-    expected = output_dir
-    assert actual == output_dir + "MOPT/" + "1863/" + "02/" + "16/"
+    # The first four paths match the P_SERVICE pattern, the fifth the
+    # P_SERVICE_SUBDAY pattern & the sixth & seventh the P_LSIDYV pattern.
+    actual = extract_file_path_stubs(paths, working_dir)
+    assert actual == stubs
+
+    actual = extract_file_path_stubs(paths, working_dir, sort_them=True)
+    assert actual == sorted(stubs)
+
+    # Unmatched paths are written to the unmatched file.
+    unmatched_path = "/data/JISC/unmatched.xml"
+    with raises(RuntimeError, match=f"1 of {len(paths) + 1} files did not match"):
+        extract_file_path_stubs(paths + [unmatched_path], working_dir)
+    with open(os.path.join(working_dir, constants.NAME_UNMATCHED_FILE)) as reader:
+        assert reader.read() == f"{unmatched_path}\n"
+
+
+def test_standardised_output_subdir_depths():
+    # determine_from_to truncates the standardised output subdirectory to each
+    # of these depths in turn.
+    len_subdirs = [
+        constants.LEN_TITLE_CODE_DIR,
+        constants.LEN_TITLE_CODE_Y_DIR,
+        constants.LEN_TITLE_CODE_YM_DIR,
+        constants.LEN_TITLE_CODE_YMD_DIR,
+    ]
+
+    # Test with full paths matching the P_SERVICE, P_SERVICE_SUBDAY & P_LSIDYV
+    # patterns.
+    full_paths = {
+        paths[0]: ["BDPO/", "BDPO/1894/", "BDPO/1894/11/", "BDPO/1894/11/07/"],
+        paths[4]: ["LEMR/", "LEMR/1873/", "LEMR/1873/01/", "LEMR/1873/01/04/"],
+        "/data/JISC/JISC2/lsidyv100b3f/MOPT-1863-02-16.xml": [
+            "MOPT/",
+            "MOPT/1863/",
+            "MOPT/1863/02/",
+            "MOPT/1863/02/16/",
+        ],
+    }
+    for full_path, expected in full_paths.items():
+        subdir = standardised_output_subdir(full_path)
+        assert [subdir[:len_subdir] for len_subdir in len_subdirs] == expected
 
 
 def test_standardised_output_subdir():
@@ -288,6 +381,37 @@ def test_determine_from_to(fs):
     assert actual[1] == expected_to
 
 
+def test_standardise_output_dirs(fs):
+    output_subdir = "/home/output/LEMR/"
+    fs.create_file(output_subdir + "1873/01/03/service/WO1_LEMR_1873_01_03-0001.xml")
+    fs.create_file(
+        output_subdir + "1873/01/04_S/service/WO1_LEMR_1873_01_04_S-0001.xml"
+    )
+    standardise_output_dirs(output_subdir)
+    assert utils.list_files(output_subdir, sort_them=True) == [
+        output_subdir + "1873/01/03/WO1_LEMR_1873_01_03-0001.xml",
+        output_subdir + "1873/01/04/WO1_LEMR_1873_01_04_S-0001.xml",
+    ]
+    assert not os.path.exists(output_subdir + "1873/01/04_S")
+
+    # Files directly in a subday subdirectory end up in the day subdirectory.
+    fs.create_file(output_subdir + "1873/01/05_S/WO1_LEMR_1873_01_05_S-0001.xml")
+    fs.create_file(
+        output_subdir + "1873/01/05_S/service/WO1_LEMR_1873_01_05_S-0002.xml"
+    )
+    standardise_output_dirs(output_subdir)
+    assert utils.list_files(output_subdir + "1873/01/05/", sort_them=True) == [
+        output_subdir + "1873/01/05/WO1_LEMR_1873_01_05_S-0001.xml",
+        output_subdir + "1873/01/05/WO1_LEMR_1873_01_05_S-0002.xml",
+    ]
+    assert not os.path.exists(output_subdir + "1873/01/05_S")
+
+    # Files left outside a standard subdirectory are an error.
+    fs.create_file(output_subdir + "1873/01/WO1_LEMR_1873_01-0001.xml")
+    with raises(RuntimeError):
+        standardise_output_dirs(output_subdir)
+
+
 def test_fix_title_code_anomaly():
     working_dir = "/home/working_dir/"
     path = "/data/JISC/JISC2/lsidyv785a3/LAGER-1892-12-31_mets.xml"
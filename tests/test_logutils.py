@@ -1,5 +1,8 @@
 """Tests for logging.py"""
 
+import logging
+from logging.handlers import QueueHandler
+
 from jisc_wrangler import logutils
 
 
@@ -32,3 +35,29 @@ def test_setup_logging(fs, mocker):
         lines = reader.readlines()
     assert len(lines) == 2
     assert "DRY RUN" in lines[-1]
+
+
+def test_queue_logging():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        with logutils.queue_logging() as log_queue:
+            # As a worker process would, via setup_worker_logging.
+            worker_logger = logging.getLogger("worker")
+            worker_logger.propagate = False
+            worker_logger.addHandler(QueueHandler(log_queue))
+            worker_logger.warning("Processing file %s", "abc.xml")
+    finally:
+        root.removeHandler(handler)
+        worker_logger.handlers.clear()
+    assert [record.getMessage() for record in records] == ["Processing file abc.xml"]
+
+
+def test_queue_logging_threads(mocker):
+    listener = mocker.patch("jisc_wrangler.logutils.QueueListener")
+    with logutils.queue_logging(processes=False) as log_queue:
+        assert log_queue is None
+    listener.assert_not_called()
@@ -1,5 +1,7 @@
+import hashlib
 import os
-from datetime import datetime
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 from pytest import raises
 
@@ -8,12 +10,6 @@ from jisc_wrangler import constants, utils
 from .test_constants import *
 
 
-def test_flattern():
-    nested_list = [["a", 1], ["b", 2], ["c", 3], ["d", 4], ["e", 5]]
-    expeted = ["a", 1, "b", 2, "c", 3, "d", 4, "e", 5]
-    assert utils.flatten(nested_list) == expeted
-
-
 def test_list_files(fs):
     # Use pyfakefs to fake the filesystem.
     dir = "/home/"
@@ -34,6 +30,53 @@ def test_list_files(fs):
     )
 
 
+def test_walk_files(fs):
+    fs.create_file("/home/output/ABCD/abc.xml")
+    fs.create_file("/home/output/xyz.txt")
+    assert list(utils.walk_files("/home/output/")) == [
+        ("/home/output/", ["xyz.txt"]),
+        ("/home/output/ABCD", ["abc.xml"]),
+    ]
+
+
+def test_walk_files_threaded(fs, mocker):
+    fs.create_file("/home/output/ABCD/abc.xml")
+    fs.create_file("/home/output/ABCD/1874/xyz.xml")
+    fs.create_file("/home/output/xyz.txt")
+    assert sorted(utils.walk_files_threaded("/home/output/", 4)) == sorted(
+        utils.walk_files("/home/output/")
+    )
+    assert list(utils.walk_files_threaded("/home/missing/", 4)) == []
+
+    # Small trees are walked without starting the pool, and larger ones with.
+    pool = mocker.patch(
+        "jisc_wrangler.utils.ThreadPoolExecutor", wraps=ThreadPoolExecutor
+    )
+    walked = sorted(utils.walk_files("/home/output/"))
+    assert sorted(utils.walk_files_threaded("/home/output/", 4)) == walked
+    pool.assert_not_called()
+    assert sorted(utils.walk_files_threaded("/home/output/", 4, min_dirs=2)) == walked
+    pool.assert_called_once_with(max_workers=4)
+    assert utils.list_files("/home/output/", ".xml", True, max_workers=4) == [
+        "/home/output/ABCD/1874/xyz.xml",
+        "/home/output/ABCD/abc.xml",
+    ]
+
+
+def test_iter_files(fs):
+    fs.create_file("/home/output/ABCD/abc_metadata.xml")
+    fs.create_file("/home/output/ABCD/abc.txt")
+    fs.create_file("/home/output/xyz_metadata.xml")
+    files = utils.iter_files("/home/output/", "_metadata.xml")
+    assert not isinstance(files, list)
+    # Files in a directory come before those in its subdirectories.
+    assert list(files) == [
+        "/home/output/xyz_metadata.xml",
+        "/home/output/ABCD/abc_metadata.xml",
+    ]
+    assert list(utils.iter_files("/home/missing/")) == []
+
+
 def test_count_lines(fs):
     filenumber = 120
     file_contents = "\n".join([f"{i}" for i in range(filenumber)])
@@ -41,6 +84,20 @@ def test_count_lines(fs):
     fs.create_file(fakefile, contents=file_contents)
     assert utils.count_lines(fakefile) == filenumber
     assert utils.count_lines(fakefile.replace(".txt", "_.txt")) == 0
+    fs.create_file("/home/newline.txt", contents=file_contents + "\n")
+    assert utils.count_lines("/home/newline.txt") == filenumber
+    fs.create_file("/home/empty.txt")
+    assert utils.count_lines("/home/empty.txt") == 0
+
+
+def test_count_files(fs):
+    fs.create_dir("/home/output/ABCD/")
+    for i in range(4):
+        fs.create_file(f"/home/output/ABCD/abc-{i}_metadata.xml")
+        fs.create_file(f"/home/output/ABCD/abc-{i}.txt")
+    assert utils.count_files("/home/output/") == 8
+    assert utils.count_files("/home/output/", "_metadata.xml") == 4
+    assert utils.count_files("/home/missing/") == 0
 
 
 def test_count_all_files(fs):
@@ -89,13 +146,17 @@ def test_count_matches_in_list():
     p = "/data/JISC/JISC1_VOL"
     assert utils.count_matches_in_list(p, l) == 0
 
+    # Counting can begin part way through the list.
+    l = paths.copy()
+    assert utils.count_matches_in_list("/data/JISC/JISC1_VOL", l, 2) == 2
+    assert utils.count_matches_in_list(stubs[0], l, 1) == 1
+    assert utils.count_matches_in_list(stubs[0], l, len(l)) == 0
 
-def test_remove_duplicates():
-    before = ["a", "b", "d", "c", "a"]
-    after = ["a", "b", "d", "c"]
-    after_sort = ["a", "b", "c", "d"]
-    assert len(utils.remove_duplicates(before)) == len(after)
-    assert utils.remove_duplicates(before, sort_them=True) == after_sort
+    # Long runs of matches are counted in full.
+    for n in range(1, 40):
+        l = ["ab"] * n + ["b"] * 5
+        assert utils.count_matches_in_list("a", l) == n
+        assert utils.count_matches_in_list("a", l[:n]) == n
 
 
 def test_hash_file(fs):
@@ -103,7 +164,74 @@ def test_hash_file(fs):
     file_contents = "\n".join([f"{i}" for i in range(filenumber)])
     fakefile = "/home/xyz.txt"
     fs.create_file(fakefile, contents=file_contents)
-    assert utils.hash_file(fakefile) == "553cb5c5e571a4e16e897e58364e1212"
+    assert (
+        utils.hash_file(fakefile, algorithm="md5") == "553cb5c5e571a4e16e897e58364e1212"
+    )
+    expected = hashlib.sha256(file_contents.encode()).hexdigest()
+    assert utils.hash_file(fakefile) == expected
+    assert utils.hash_file(fakefile, blocksize=7) == expected
+    expected = hashlib.sha256(file_contents[:10].encode()).hexdigest()
+    assert utils.hash_file(fakefile, limit=10) == expected
+    assert utils.hash_file(fakefile, blocksize=3, limit=10) == expected
+
+
+def test_hash_file_mapped(tmp_path):
+    # A real file, which is hashed via a memory map.
+    path = tmp_path / "xyz.txt"
+    path.write_bytes(b"abc" * 1000)
+    expected = hashlib.sha256(b"abc" * 1000).hexdigest()
+    assert utils.hash_file(str(path)) == expected
+    assert utils.hash_file(str(path), blocksize=7) == expected
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert utils.hash_file(str(empty)) == hashlib.sha256(b"").hexdigest()
+
+    # A file that has changed since it was hashed is hashed again.
+    path.write_bytes(b"xyz")
+    assert utils.hash_file(str(path)) == hashlib.sha256(b"xyz").hexdigest()
+
+
+def test_hash_files(fs, mocker):
+    fs.create_file("/home/abc.txt", contents="abc")
+    fs.create_file("/home/xyz.txt", contents="xyz")
+    assert utils.hash_files(["/home/abc.txt", "/home/xyz.txt"]) == [
+        utils.hash_file("/home/abc.txt"),
+        utils.hash_file("/home/xyz.txt"),
+    ]
+
+    # Small files are hashed in turn, and larger ones concurrently.
+    pool = mocker.patch(
+        "jisc_wrangler.utils.ThreadPoolExecutor", wraps=ThreadPoolExecutor
+    )
+    utils.hash_files(["/home/abc.txt", "/home/xyz.txt"])
+    pool.assert_not_called()
+    large = b"x" * (constants.HASH_BLOCKSIZE + 1)
+    fs.create_file("/home/large.txt", contents=large)
+    fs.create_file("/home/large2.txt", contents=large + b"y")
+    assert utils.hash_files(
+        ["/home/large.txt", "/home/abc.txt", "/home/large2.txt"]
+    ) == [
+        hashlib.sha256(large).hexdigest(),
+        utils.hash_file("/home/abc.txt"),
+        hashlib.sha256(large + b"y").hexdigest(),
+    ]
+    pool.assert_called_once_with(max_workers=3)
+
+
+def test_same_file_contents(fs):
+    fs.create_file("/home/abc.txt", contents="abc")
+    fs.create_file("/home/abc2.txt", contents="abc")
+    fs.create_file("/home/abd.txt", contents="abd")
+    fs.create_file("/home/abcd.txt", contents="abcd")
+    assert utils.same_file_contents("/home/abc.txt", "/home/abc2.txt")
+    assert not utils.same_file_contents("/home/abc.txt", "/home/abd.txt")
+    assert not utils.same_file_contents("/home/abc.txt", "/home/abcd.txt")
+
+    # Files that differ after the first block.
+    head = "x" * constants.HASH_BLOCKSIZE
+    fs.create_file("/home/long1.txt", contents=head + "abc")
+    fs.create_file("/home/long2.txt", contents=head + "abd")
+    assert not utils.same_file_contents("/home/long1.txt", "/home/long2.txt")
 
 
 def test_alt_output_file():
@@ -118,6 +246,59 @@ def test_alt_output_file():
     assert actual == expected
 
 
+def test_kernel_copy(fs):
+    fs.create_file("/home/input/abc.txt", contents="abc")
+    fs.create_dir("/home/output/")
+    utils.kernel_copy("/home/input/abc.txt", "/home/output/abc.txt")
+    with open("/home/output/abc.txt", "r") as reader:
+        assert reader.read() == "abc"
+    assert not os.path.samefile("/home/input/abc.txt", "/home/output/abc.txt")
+
+
+def test_fast_copy(fs):
+    fs.create_file("/home/input/abc.txt", contents="abc")
+    fs.create_dir("/home/output/")
+    utils.fast_copy("/home/input/abc.txt", "/home/output/abc.txt")
+    with open("/home/output/abc.txt", "r") as reader:
+        assert reader.read() == "abc"
+    # On the same filesystem the file is hard linked.
+    assert os.path.samefile("/home/input/abc.txt", "/home/output/abc.txt")
+
+
+def test_fast_copy_existing_destination(tmp_path):
+    src1 = tmp_path / "abc-1.txt"
+    src2 = tmp_path / "abc-2.txt"
+    dst = tmp_path / "output" / "abc.txt"
+    src1.write_text("abc")
+    src2.write_text("xyz")
+    dst.parent.mkdir()
+
+    # The destination is a hard link to the first source.
+    utils.fast_copy(str(src1), str(dst))
+    assert os.path.samefile(src1, dst)
+
+    # Replacing the destination leaves the first source untouched.
+    utils.fast_copy(str(src2), str(dst))
+    assert src1.read_text() == "abc"
+    assert dst.read_text() == "xyz"
+    assert os.path.samefile(src2, dst)
+
+    # Linking a file over itself is a no-op, and no temporary files remain.
+    utils.fast_copy(str(src2), str(dst))
+    assert os.path.samefile(src2, dst)
+    assert os.listdir(dst.parent) == ["abc.txt"]
+
+
+def test_copy_function():
+    assert utils.copy_function("copy") is shutil.copy
+    assert utils.copy_function("copy", preserve_times=True) is shutil.copy2
+    assert utils.copy_function("hardlink", preserve_times=True) is utils.fast_copy
+    assert utils.copy_function("reflink") is utils.kernel_copy
+    assert utils.copy_function("hardlink") is utils.fast_copy
+    with raises(ValueError):
+        utils.copy_function("symlink")
+
+
 def test_list_all_subdirs(fs):
     # Use pyfakefs to fake the filesystem
     dir = "/home/"
@@ -155,6 +336,29 @@ def test_move_from_to(fs):
     for i in range(4):
         assert os.path.exists(dir2 + f"abc-{i}.xml")
 
+    # Files are moved into an existing target directory.
+    fs.create_file(dir1 + "abc-4.xml")
+    utils.move_from_to(dir1, dir2)
+    assert not os.path.isdir(dir1)
+    assert len(os.listdir(dir2)) == 5
+
+    # Files are not overwritten.
+    fs.create_file(dir1 + "abc-0.xml")
+    with raises(FileExistsError):
+        utils.move_from_to(dir1, dir2)
+
+    # A directory with nested subdirectories is not simply renamed: its files
+    # are all moved into the target directory, which leaves the subdirectories
+    # behind (so the source directory cannot be removed).
+    dir3 = "/home/output3/"
+    fs.create_file(dir3 + "abc.xml")
+    fs.create_file(dir3 + "sub/def.xml")
+    dir4 = "/home/output4/"
+    with raises(OSError):
+        utils.move_from_to(dir3, dir4)
+    assert sorted(os.listdir(dir4)) == ["abc.xml", "def.xml"]
+    assert os.listdir(dir3) == ["sub"]
+
 
 def test_write_unmactched_file(fs):
     testdir = "/home/output/"
@@ -181,29 +385,33 @@ def test_ignore_file(fs):
     assert not os.path.exists(ignoredir + "jw_ignored.txt")
     utils.ignore_file(testfile, ignoredir)
     assert os.path.exists(ignoredir + "jw_ignored.txt")
+    utils.close_appended_files()
     with open(ignoredir + "jw_ignored.txt", "r") as reader:
         assert reader.read().rstrip() == testfile
     testfile2 = testdir + "ignoremetoo.txt"
     utils.ignore_file(testfile2, ignoredir)
+    utils.close_appended_files()
     with open(ignoredir + "jw_ignored.txt", "r") as reader:
         assert reader.readlines()[-1].rstrip() == testfile2
 
 
-def test_date_in_range():
-    start = datetime.strptime("01-03-2023", "%d-%m-%Y")
-    end = datetime.strptime("01-04-2023", "%d-%m-%Y")
-    date_between = datetime.strptime("15-03-2023", "%d-%m-%Y")
-    date_before = datetime.strptime("01-02-2023", "%d-%m-%Y")
-    date_after = datetime.strptime("01-05-2023", "%d-%m-%Y")
-    assert utils.date_in_range(start, end, date_before) is False
-    assert utils.date_in_range(start, end, date_between) is True
-    assert utils.date_in_range(start, end, date_after) is False
-    errormsg = f"Invalid date interval. Start: {end}, End: {start}."
-    with raises(ValueError, match=errormsg):
-        utils.date_in_range(end, start, date_between)
+def test_append_line(fs):
+    testfile = "/home/output/lines.txt"
+    fs.create_dir("/home/output/")
+    utils.append_line(testfile, "abc")
+    utils.append_line(testfile, "xyz")
+    utils.close_appended_files()
+    utils.append_line(testfile, "def")
+    utils.close_appended_files()
+    with open(testfile, "r") as reader:
+        assert reader.read() == "abc\nxyz\ndef\n"
 
 
-def test_parse_publication_date():
+def test_parse_iso_date():
     date_str = "1999-01-01"
-    expected = ("1999", "01", "01")
-    assert expected == utils.parse_publicaton_date(date_str)
+    expected = (1999, 1, 1)
+    assert expected == utils.parse_iso_date(date_str)
+    with raises(ValueError):
+        utils.parse_iso_date("1999-1-1")
+    with raises(ValueError):
+        utils.parse_iso_date("1999/01/01")